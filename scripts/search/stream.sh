@@ -0,0 +1,2 @@
+#!/bin/bash
+python /app/execute.py "stream" /app/config/args.json
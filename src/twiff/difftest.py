@@ -0,0 +1,142 @@
+"""
+Differential parser testing: runs a candidate parser against the reference parser over a seeded synthetic
+corpus of twiffs and reports every output mismatch, along with the throughput of both parsers.
+
+"""
+import time
+import logging
+
+from typing import *
+from argparse import ArgumentParser, Namespace
+
+from twiff import load_module
+from twiff.utils import serial
+from twiff.utils.corpus import TwiffCorpus
+from twiff.interact.records import to_dict
+
+log = logging.getLogger(__name__)
+
+
+def call(parser:Callable, tweet:Dict, users:Dict) -> Tuple[Any, float]:
+    """ Parses a tweet, returning the result (or the exception type name, so that failures are compared too)
+        and the time taken.
+    """
+    start = time.perf_counter()
+    try:
+        result = parser(tweet, users)
+    except Exception as e:
+        result = f"{type(e).__name__}"
+    return result, time.perf_counter() - start
+
+
+def compare(reference:Callable, candidate:Callable, corpus:Iterable[Tuple[Dict, Dict]], max_mismatches:Optional[int]=20) -> Dict:
+    """ Compares the outputs of two parsers over a corpus.
+
+        Args:
+            reference (Callable): Reference parser (e.g. T4FParser).
+            candidate (Callable): Parser under test.
+            corpus (Iterable[Tuple[Dict, Dict]]): Tweets and their users.
+            max_mismatches (Optional[int]=20): Number of mismatching samples kept in the report.
+
+        Returns:
+            report (Dict):
+                count (int): Number of tweets parsed.
+                mismatches (int): Number of tweets with differing output.
+                samples (List[Dict]): First mismatching tweets with both outputs.
+                reference_rate, candidate_rate (float): Tweets per second.
+                speedup (float): Candidate throughput relative to the reference.
+
+    """
+    count, mismatches, samples = 0, 0, []
+    reference_time, candidate_time = 0.0, 0.0
+    for tweet, users in corpus:
+        expected, elapsed = call(reference, tweet, users)
+        reference_time += elapsed
+        actual, elapsed = call(candidate, tweet, users)
+        candidate_time += elapsed
+        count += 1
+        if expected != actual:
+            mismatches += 1
+            if len(samples) < max_mismatches:
+                samples.append({"tweet": tweet, "users": users, "reference": to_dict(expected), "candidate": to_dict(actual)})
+        if count % 100000 == 0:
+            log.info("Compared %d tweets, %d mismatches.", count, mismatches)
+
+    reference_rate = count / reference_time if reference_time else 0.0
+    candidate_rate = count / candidate_time if candidate_time else 0.0
+    return {"count": count,
+            "mismatches": mismatches,
+            "samples": samples,
+            "reference_rate": reference_rate,
+            "candidate_rate": candidate_rate,
+            "speedup": candidate_rate / reference_rate if reference_rate else 0.0}
+
+
+def run(args:Namespace) -> Dict:
+    '''
+    Loads the "parser" (reference) and "candidate-parser" entries of the configuration and compares them.
+    '''
+    log.info("Difftest Arguments: %s", args)
+
+    # Configuration
+    config = serial.load(args.config)
+
+    # The corpus gives ignored users made-up IDs: the parsers must not write them back to ignored_users.json.
+    reference = load_module(config, "parser", persist_ignored_users=False)
+    candidate = load_module(config, "candidate-parser", persist_ignored_users=False)
+    if candidate is None:
+        raise ValueError("No candidate-parser provided in the configuration.")
+
+    # Corpus exercising the reference parser's banned words and ignored users.
+    ignored_users = [val for (key, val) in getattr(reference, "IgnoredUsers", {}).items() if key != "COMMENT"]
+    corpus = TwiffCorpus(seed=args.seed, banned_words=getattr(reference, "BannedWords", None), ignored_users=ignored_users)
+
+    report = compare(reference, candidate, corpus.generate(args.count), max_mismatches=args.max_mismatches)
+    log.info("Compared %d tweets: %d mismatches. Reference %.0f tweets/s, candidate %.0f tweets/s (x%.2f).",
+             report["count"], report["mismatches"], report["reference_rate"], report["candidate_rate"], report["speedup"])
+
+    if args.output is not None:
+        serial.dump(report, args.output, indent=2, default=str)
+    return report
+
+
+def get_arg_parser() -> ArgumentParser:
+    '''
+    Argument Parser
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description='Twiff Differential Parser Test',
+                                     epilog='Please contact Sam for further help.')
+    parser.add_argument('--config', type=str,
+                        help='Configuration file with "parser" and "candidate-parser" entries.')
+    parser.add_argument('--count', type=int, default=1000000,
+                        help='Number of synthetic tweets.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Corpus random seed.')
+    parser.add_argument('--max_mismatches', type=int, default=20,
+                        help='Number of mismatching samples kept in the report.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Path of the JSON report.')
+    return parser
+
+
+def parse_args(args:Optional[Dict[str,Any]]={}) -> Namespace:
+    '''
+    Parse Arguments
+    '''
+    parser = get_arg_parser()
+    parser.set_defaults(**args)
+    args = parser.parse_args([])
+    return args
+
+
+def main(args:Optional[Dict[str,Any]]={}) -> None:
+    '''
+    Entry point.
+    '''
+    args = parse_args(args)
+    run(args)
+
+
+if __name__=='__main__':
+    main()
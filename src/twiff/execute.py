@@ -1,7 +1,6 @@
 import os
 import sys
 import uuid
-import json
 import logging
 from importlib import import_module
 
@@ -9,21 +8,9 @@ log = logging.getLogger(__name__)
 
 
 def main():
-    # Logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format="Twitter4Future: [ %(asctime)s ] %(name)s | %(levelname)s | %(message)s", 
-        datefmt="%m/%d/%Y %I:%M:%S%p", 
-        handlers = [
-            logging.FileHandler(f"/home/deploy/gamechanger/twiff/logs/out.log", mode='a'),
-            logging.StreamHandler()
-        ]
-    )
-    log.info(f"Executing {sys.argv[1]}...")
-    
     # Ensure correct number of args
     if len(sys.argv) < 3:
-        log.warning(f"Require use instruction and config file as an argument.")
+        log.warning("Require use instruction and config file as an argument.")
         sys.exit(1)
         
     # Ensure src path is in sys path
@@ -32,8 +19,14 @@ def main():
         sys.path.append(base_path)
         
     # Load configuration for run
-    with open(sys.argv[2], 'r') as fp:
-        args = json.load(fp)
+    from twiff.utils import serial
+    args = serial.load(sys.argv[2])
+        
+    # Logging: queued, written by a background thread
+    from twiff.utils.logs import setup_logging
+    setup_logging(path=args.pop("log_path", None), level=args.pop("log_level", "INFO"), 
+                  max_bytes=args.pop("log_max_bytes", 10485760), backup_count=args.pop("log_backup_count", 5))
+    log.info("Executing %s...", sys.argv[1])
         
     # Execute requested mode
     module = import_module(f"twiff.{sys.argv[1]}")
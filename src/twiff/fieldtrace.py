@@ -0,0 +1,184 @@
+"""
+Field tracing: runs the configured parser (and the tweet accessors of the interaction stages) over archived or
+synthetic tweets wrapped in recording dicts, and reports which tweet and user keys are actually read, compared
+with the field profile the search requests.
+
+"""
+import logging
+
+from typing import *
+from pathlib import Path
+from argparse import ArgumentParser, Namespace
+
+from twiff import load_module
+from twiff.utils import serial
+from twiff.utils.corpus import TwiffCorpus
+from twiff.reparse import list_items, read_items
+from twiff.search import quoted_usernames, field_profile
+
+log = logging.getLogger(__name__)
+
+
+class TracedDict(dict):
+    """ Dict recording the (dotted) path of every key read or tested, nested dicts and lists are traced too.
+    """
+
+    def __init__(self, data:Dict, path:str, seen:Set[str]) -> None:
+        super().__init__(data)
+        self.path, self.seen = path, seen
+
+    def _key(self, key:str) -> str:
+        return f"{self.path}.{key}" if self.path else key
+
+    def __getitem__(self, key:str) -> Any:
+        self.seen.add(self._key(key))
+        return traced(super().__getitem__(key), self._key(key), self.seen)
+
+    def get(self, key:str, default:Optional[Any]=None) -> Any:
+        self.seen.add(self._key(key))
+        return traced(super().get(key, default), self._key(key), self.seen)
+
+    def __contains__(self, key:str) -> bool:
+        self.seen.add(self._key(key))
+        return super().__contains__(key)
+
+    def values(self) -> List[Any]:
+        return [self[key] for key in self]
+
+    def items(self) -> List[Tuple[str,Any]]:
+        return [(key, self[key]) for key in self]
+
+
+class TracedList(list):
+
+    def __init__(self, data:List, path:str, seen:Set[str]) -> None:
+        super().__init__(data)
+        self.path, self.seen = path, seen
+
+    def __getitem__(self, idx:int) -> Any:
+        return traced(super().__getitem__(idx), self.path, self.seen)
+
+    def __iter__(self) -> Iterator[Any]:
+        return (traced(item, self.path, self.seen) for item in super().__iter__())
+
+
+def traced(value:Any, path:str, seen:Set[str]) -> Any:
+    if isinstance(value, dict) and not isinstance(value, TracedDict):
+        return TracedDict(value, path, seen)
+    if isinstance(value, list) and not isinstance(value, TracedList):
+        return TracedList(value, path, seen)
+    return value
+
+
+def trace(parser:Callable, corpus:Iterable[Tuple[Dict, Dict]]) -> Dict:
+    """ Collects the tweet and user keys read while parsing a corpus.
+
+        Args:
+            parser (Callable): Parser, e.g. T4FParser.
+            corpus (Iterable[Tuple[Dict, Dict]]): Tweets and their users.
+
+        Returns:
+            report (Dict):
+                count (int): Number of tweets parsed.
+                tweet_keys, user_keys (List[str]): Dotted paths of the keys read.
+
+    """
+    count, tweet_keys, user_keys = 0, set(), set()
+    for tweet, users in corpus:
+        tweet = TracedDict(tweet, "", tweet_keys)
+        users = {id_str:TracedDict(user, "", user_keys) for (id_str, user) in users.items()}
+        try:
+            parser(tweet, users)
+        except Exception as e:
+            log.debug("Parser failed on tweet ID (%s): %r", dict.get(tweet, "id"), e)
+        # Read by the interaction stages: quoted authors and the shard key
+        quoted_usernames({"": tweet})
+        tweet.get("conversation_id")
+        count += 1
+    return {"count": count, "tweet_keys": sorted(tweet_keys), "user_keys": sorted(user_keys)}
+
+
+def archive(output:Path, count:int) -> Iterator[Tuple[Dict, Dict]]:
+    users = read_items(list_items(output, "users"))
+    for path in list_items(output, "tweets")[:count]:
+        tweet = read_items([path])[path.name.split('.')[0]]
+        yield tweet, users
+
+
+def run(args:Namespace) -> Dict:
+    '''
+    Traces the configured "parser" and compares the keys it reads with the configured search field profile.
+    '''
+    log.info("Fieldtrace Arguments: %s", args)
+
+    # Configuration
+    config = serial.load(args.config)
+    # The synthetic corpus gives ignored users made-up IDs: the parser must not write them back to ignored_users.json.
+    parser = load_module(config, "parser", persist_ignored_users=False)
+
+    # Archived tweets carry every requested field, the synthetic corpus only what twiffs need
+    if args.output is not None:
+        corpus = archive(Path(args.output), args.count)
+    else:
+        ignored_users = [val for (key, val) in getattr(parser, "IgnoredUsers", {}).items() if key != "COMMENT"]
+        corpus = TwiffCorpus(seed=args.seed, banned_words=getattr(parser, "BannedWords", None), ignored_users=ignored_users).generate(args.count)
+
+    report = trace(parser, corpus)
+    tweet_fields = {key.split(".")[0] for key in report["tweet_keys"]}
+    user_fields = {key.split(".")[0] for key in report["user_keys"]}
+    fields = field_profile(config.get("search", {}).get("config", {}).get("fields", "full"), config.get("field-profiles"))
+    report["unused"] = {"tweet_fields": [field for field in fields["tweet_fields"] if field not in tweet_fields],
+                        "user_fields": [field for field in fields["user_fields"] if field not in user_fields]}
+    report["missing"] = {"tweet_fields": sorted(tweet_fields.difference(fields["tweet_fields"])),
+                         "user_fields": sorted(user_fields.difference(fields["user_fields"]))}
+
+    log.info("Traced %d tweets. Tweet keys read: %s. User keys read: %s.", report["count"], ", ".join(report["tweet_keys"]), ", ".join(report["user_keys"]))
+    log.info("Requested but never read: tweet fields %s, user fields %s.", report["unused"]["tweet_fields"], report["unused"]["user_fields"])
+    if report["missing"]["tweet_fields"] or report["missing"]["user_fields"]:
+        log.warning("Read but not requested: tweet fields %s, user fields %s.", report["missing"]["tweet_fields"], report["missing"]["user_fields"])
+
+    if args.report is not None:
+        serial.dump(report, args.report, indent=2)
+    return report
+
+
+def get_arg_parser() -> ArgumentParser:
+    '''
+    Argument Parser
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description='Parser Field Trace',
+                                     epilog='Please contact Sam for further help.')
+    parser.add_argument('--config', type=str,
+                        help='Configuration file with the "parser" entry and (optionally) the "search" field profile.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Archive directory to trace, a synthetic corpus is used if not set.')
+    parser.add_argument('--count', type=int, default=10000,
+                        help='Number of tweets to trace.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the synthetic corpus.')
+    parser.add_argument('--report', type=str, default=None,
+                        help='Path of the JSON report.')
+    return parser
+
+
+def parse_args(args:Optional[Dict[str,Any]]={}) -> Namespace:
+    '''
+    Parse Arguments
+    '''
+    parser = get_arg_parser()
+    parser.set_defaults(**args)
+    args = parser.parse_args([])
+    return args
+
+
+def main(args:Optional[Dict[str,Any]]={}) -> None:
+    '''
+    Entry point.
+    '''
+    args = parse_args(args)
+    run(args)
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,117 @@
+import re
+import sys
+import logging
+
+from typing import *
+
+log = logging.getLogger(__name__)
+
+# Field grammar used when parser.json has no (or a partial) "grammar" section; matches the original
+# hard-coded TwiffParser_v2 rules.
+DEFAULT_GRAMMAR = {
+    "hashtags": ["#twiff", "#Twiff", "#TWIFF"],
+    "prefix_length": 6,
+    "min_length": 10,
+    "delimiter_pattern": "[^\\w ]|_",
+    "cut_markers": ["\n", "https://t.co/"],
+    "strip_chars": " ()[]{}#\n",
+    "url_prefix": "http",
+    "text_fields": ["organization", "country", "state", "city"],
+    "fallbacks": {"city": "state"},
+    "truncate": {"country": ".", "state": ".", "city": "."},
+    "checks": [
+        {"field": "organization", "min": 3, "max": 50, "forbid": ["http"], "error": "no_org_found"},
+        {"field": "country", "min": 2, "max": 35, "forbid": ["http"], "error": "no_country_found"},
+        {"field": "state", "max": 35, "forbid": ["http"], "error": "no_state_found"},
+        {"field": "city", "max": 60, "forbid": ["http"], "error": "no_city_found"},
+        {"field": "num_people", "min": 1, "error": "no_people_found"}
+    ],
+    "errors": {"no_hashtag": "hashtag_twiff_not_found", "too_short": "twifftext_too_short"}
+}
+
+# Field kinds, selected by the first character of a data field.
+NUMERIC, PREFIXED, TEXT = "numeric", "prefixed", "text"
+
+
+class Grammar:
+    """ Twiff field grammar compiled from the "grammar" section of parser.json.
+
+        Data fields are classified through a first-character lookup table: a field can only be the number of
+        people or a date if it starts with a numeric character, and only a URL if it starts with the first
+        character of the URL prefix, so each field needs a single table lookup plus at most one string test.
+        The table is seeded with the URL prefix and filled in lazily for every other character seen.
+
+        Args:
+            config (Dict): Grammar configuration, missing keys default to DEFAULT_GRAMMAR.
+
+        Example::
+            >>> grammar = Grammar(config.get("grammar", {}))
+            >>> grammar.classify("12", people_found=False)
+            'num_people'
+    """
+
+    def __init__(self, config:Dict) -> None:
+        config = {**DEFAULT_GRAMMAR, **config}
+        self.hashtags = tuple(config["hashtags"])
+        self.prefix_length = config["prefix_length"]
+        self.min_length = config["min_length"]
+        self.delimiter = re.compile(config["delimiter_pattern"])
+        self.cut_markers = tuple(config["cut_markers"])
+        self.strip_chars = config["strip_chars"]
+        self.url_prefix = config["url_prefix"]
+        self.text_fields = tuple(config["text_fields"])
+        self.fallbacks = dict(config["fallbacks"])
+        self.truncate = dict(config["truncate"])
+        self.checks = tuple((check["field"], check.get("min"), check.get("max"), tuple(check.get("forbid", ())), sys.intern(check["error"]))
+                            for check in config["checks"])
+        # Error codes end up in every failed parsed tweet, share a single copy of each.
+        self.errors = {key:sys.intern(error) for (key, error) in {**DEFAULT_GRAMMAR["errors"], **config["errors"]}.items()}
+
+        self.table = {self.url_prefix[0]: PREFIXED}
+
+    def find_start(self, text:str) -> int:
+        # Hashtag variants are tried in configured order, the first one present wins.
+        for hashtag in self.hashtags:
+            start = text.find(hashtag)
+            if start >= 0:
+                return start
+        return -1
+
+    def find_delimiter(self, text:str) -> str:
+        match = self.delimiter.search(text, self.prefix_length)
+        return match.group() if match is not None else ""
+
+    def cut(self, text:str) -> str:
+        for marker in self.cut_markers:
+            if marker in text:
+                text = text.split(marker)[0]
+        return text
+
+    def kind(self, char:str) -> str:
+        kind = self.table.get(char)
+        if kind is None:
+            kind = self.table[char] = NUMERIC if char.isnumeric() else TEXT
+        return kind
+
+    def classify(self, field:str, people_found:bool) -> str:
+        """ Returns the slot of a non-empty data field: "num_people", "date", "url" or "text".
+        """
+        kind = self.kind(field[0])
+        if kind is NUMERIC:
+            if not people_found and field.isnumeric():
+                return "num_people"
+            if field[0:2].isnumeric():
+                return "date"
+        elif kind is PREFIXED and field.startswith(self.url_prefix):
+            return "url"
+        return "text"
+
+    def validate(self, fields:Dict[str,Any]) -> List[str]:
+        errors = []
+        for (field, minimum, maximum, forbid, error) in self.checks:
+            value = fields[field]
+            size = value if isinstance(value, int) else len(value)
+            if (minimum is not None and size < minimum) or (maximum is not None and size > maximum) \
+                    or any(word in value for word in forbid):
+                errors.append(error)
+        return errors
@@ -1,5 +1,4 @@
 import datetime
-import json
 import logging
 from pathlib import Path
 
@@ -7,6 +6,10 @@ from typing import *
 
 from abc import ABC, abstractmethod
 
+from twiff.interact.grammar import Grammar
+from twiff.interact.records import ParsedTweet, TwiffData
+from twiff.utils import serial
+
 log = logging.getLogger(__name__)
 
 
@@ -27,6 +30,9 @@ class Parser(ABC):
                                 "url": sURL},
                        "errors": None}
 
+            `twiff.interact.records.ParsedTweet` implements this contract as a compact record that can be used
+            like the dict above; convert it with `to_dict` before serialising.
+
        NOTE:
             Returned key, value pairs should contain necessary information for the
             reponse_generator to select the approriate response. An example of how
@@ -49,11 +55,10 @@ class Parser(ABC):
         Initialise the TweetParser instance.
         '''
         # Load configuration from JSON file.
-        with open(config, "r") as fp:
-        self.config = json.load(fp)
+        self.config = serial.load(config)
 
     @abstractmethod
-    def __call__(self, tweet: Dict) -> Dict:
+    def __call__(self, tweet: Dict, users: Dict, referenced: Optional[Dict] = None) -> Dict:
         '''
         Forward method to parse the tweet and return parsed data fields.
         '''
@@ -70,6 +75,8 @@ class T4FParser(Parser):
 
         Args:
             tweet (Dict): Standard extended JSON tweet response.
+            users (Dict): Users of the search response, Key=user_id.
+            referenced (Optional[Dict]): Referenced tweets of the search response (includes.tweets), Key=tweet_id.
 
         Returns:
             parsed_tweet (Dict): Parsed tweet data in JSON format.
@@ -92,18 +99,24 @@ class T4FParser(Parser):
             >>> result = parser(tweets, users)
     """
 
-    def __init__(self, config: str) -> None:
+    def __init__(self, config: str, persist_ignored_users: bool = True) -> None:
         '''
         Initialise the TweetParser_v2 instance.
+
+        Ignored users found by handle are re-keyed by their ID and written back to ignored_users.json, unless
+        persist_ignored_users is False (test tools and worker processes only update their own copy).
         '''
         super(T4FParser, self).__init__(config)
 
         # Configuration
-        with open('ignored_users.json', "r") as fp:
-            self.IgnoredUsers = json.load(fp)
+        self.IgnoredUsers = serial.load('ignored_users.json')
+        self.PersistIgnoredUsers = persist_ignored_users
         self.BannedWords = self.config['banned_words']
+        self.SingleBannedWords = frozenset(self.BannedWords["single_words"])
+        # Field grammar and validation limits
+        self.Grammar = Grammar(self.config.get("grammar", {}))
 
-    def __call__(self, tweet: dict, users: dict) -> dict:
+    def __call__(self, tweet: dict, users: dict, referenced: Optional[dict] = None) -> ParsedTweet:
         '''
         Forward pass
         '''
@@ -111,29 +124,14 @@ class T4FParser(Parser):
         # To start parsing the twiff data, first extract some tweet data
         sTweetText = tweet["text"]
         dEntities = tweet["entities"]
-        r = {"response": "failed",
-             "tweettype": None,
-             "twiff_id": None,
-             "quote_id": None,
-             "data": {"num_people": 0,
-                      "created_at": "",
-                      "organization": "",
-                      "location": "",
-                      "url": ""},
-             "errors": []}
         dUrls: []
         if "urls" in dEntities:
             dUrls = dEntities["urls"]
         tTweetDate = tweet["created_at"]
         # Let's find the start of the twiff string, drop the rest, not needed
-        nTwiffStart = sTweetText.find("#twiff")
+        nTwiffStart = self.Grammar.find_start(sTweetText)
         if nTwiffStart < 0:
-            nTwiffStart = sTweetText.find("#Twiff")
-        if nTwiffStart < 0:
-            nTwiffStart = sTweetText.find("#TWIFF")
-        if nTwiffStart < 0:
-            r["errors"] = AddError_v2(r["errors"], "hashtag_twiff_not_found")
-            return r
+            return ParsedTweet(errors=[self.Grammar.errors["no_hashtag"]])
         sTwiffText = sTweetText[nTwiffStart:]
         # When the last URL is a display URL to a picture drop it too,
         # to prevent using the display URL as the quoted tweet parameter
@@ -156,11 +154,16 @@ class T4FParser(Parser):
                 if rft["type"] == "quoted":
                     sTweetID = rft["id"]
                     sTweetType = "Quoted"
+                    # Quoted tweet in the search includes: its author is known by ID, no username lookup needed
+                    dQuoted = referenced.get(sTweetID) if referenced is not None else None
                     for Url in dUrls:
                         if rft["id"] in str(Url["expanded_url"]):
                             sQuoteURL = Url["expanded_url"]
-                            sQuotedUserName = sQuoteURL.split("/")[3]
-                            sQuotedUserId = FindUserIdByName_v2(users, sQuotedUserName)
+                            if dQuoted is not None:
+                                sQuotedUserId = dQuoted["author_id"]
+                            else:
+                                sQuotedUserName = sQuoteURL.split("/")[3]
+                                sQuotedUserId = FindUserIdByName_v2(users, sQuotedUserName)
                     break
         sUserId = tweet["author_id"]
         sUserName = FindUserNameById_v2(users, sUserId)
@@ -171,7 +174,7 @@ class T4FParser(Parser):
         if sQuoteURL != "":
             r["quote_id"] = sQuoteURL.split("/")[5]
         # Check for banned words
-        if any(word in sTweetText.split() for word in self.BannedWords["single_words"]):
+        if not self.SingleBannedWords.isdisjoint(sTweetText.split()):
             r["response"] = "failed"
             r["errors"] = AddError_v2(r["errors"], "banned_word")
             r["twiff_id"] = None
@@ -194,7 +197,7 @@ class T4FParser(Parser):
         r["tweettype"] = sTweetType
         return r
 
-    def TwiffParser_v2(self, TwiffText, TweetDate, TweetURL, QuoteURL) -> dict:
+    def TwiffParser_v2(self, TwiffText, TweetDate, TweetURL, QuoteURL) -> ParsedTweet:
         """
         # Let's see if we can extract twiff data from the tweet
         # Us machines need to account for the fact that humans make mistakes,
@@ -212,91 +215,59 @@ class T4FParser(Parser):
                 #>>> log.info(result)
 
         """
-        r = {"response": "failed",
-             "tweettype": None,
-             "twiff_id": None,
-             "quote_id": None,
-             "data": {"num_people": 0,
-                      "created_at": "",
-                      "organization": "",
-                      "location": "",
-                      "url": ""},
-             "errors": []}
-        if len(TwiffText) < 10:
-            r["errors"] = AddError_v2(r["errors"], "twifftext_too_short")
+        r = ParsedTweet()
+        g = self.Grammar
+        if len(TwiffText) < g.min_length:
+            r["errors"] = AddError_v2(r["errors"], g.errors["too_short"])
             return r
 
         # let's assume the 6th character is a delimiter,
         # Unless that is a space, then check for a delimiter after the space, or numbers.
-        i = 6
-        while TwiffText[i:i + 1] == " " or TwiffText[i:i + 1].isnumeric() or TwiffText[i:i + 1].isalpha():
-            i += 1
-        sDelimiter = TwiffText[i:i + 1]
-        TwiffText = TwiffText[6:]
+        sDelimiter = g.find_delimiter(TwiffText)
+        TwiffText = TwiffText[g.prefix_length:]
         # remove the quote URL if needed
         if QuoteURL != "":
             TwiffText = TwiffText.replace(QuoteURL, "")
-        # Also cut out when a new line is started
-        if "\n" in TwiffText:
-            TwiffText = TwiffText.split("\n")[0]
-        if "https://t.co/" in TwiffText:
-            TwiffText = TwiffText.split("https://t.co/")[0]
+        # Also cut out when a new line is started, or a link follows
+        TwiffText = g.cut(TwiffText)
         # TwiffText is a string that only contains twiff data, can it contain useful information?
         # secondary check to see if continuing is useful
-        if len(TwiffText) < 10:
-            r["errors"] = AddError_v2(r["errors"], "twifftext_too_short")
+        if len(TwiffText) < g.min_length:
+            r["errors"] = AddError_v2(r["errors"], g.errors["too_short"])
             return r
         # Now we know the delimiter, create the datafields
         sDatafields = TwiffText.split(sDelimiter)
-        # Clean up actions
-        i = 0
-        while i < len(sDatafields):
-            sDatafields[i] = sDatafields[i].strip(" ()[]{}#\n")  # Sometime people use brackets :\
-            i += 1
-        # Let's try to get some results
-        nPeople = 0  # Expected as parameter 0
-        sOrganisation = ""  # Expected as parameter 1
-        sCountry = ""  # Expected as parameter 2
-        sState = ""  # Expected as parameter 3
-        sCity = ""  # Expected as parameter 4
-        tDate: datetime = None  # Expected as parameter 5
-        sURL = ""  # Expected as parameter 6
+        # Let's try to get some results, text fields are expected in the configured order
+        dFields = {sField: "" for sField in g.text_fields}
+        dFields["num_people"] = 0
+        tDate: datetime = None
+        sURL = ""
         # But humans aren't perfect, so they'll probs mess up :)
         for sDatafield in sDatafields:
+            sDatafield = sDatafield.strip(g.strip_chars)  # Sometime people use brackets :\
             if sDatafield == "":
                 continue
-            # If it's a number is must be the numer of people (0)
-            if sDatafield.isnumeric() and nPeople == 0:  # 20220415 Added 0 check
-                nPeople = int(sDatafield)
-                continue
-            # If it starts with a number, and is between 6 and 10 chars long, it must be the date(5)
-            if sDatafield[0:2].isnumeric():
+            sSlot = g.classify(sDatafield, dFields["num_people"] != 0)  # 20220415 Added 0 check
+            if sSlot == "num_people":
+                dFields["num_people"] = int(sDatafield)
+            elif sSlot == "date":
                 bOK, tDate = TryParseDateOnly_v2(sDatafield)
                 if not bOK:
                     tDate = None
-                continue
-            # The rest are text strings, we can only check for URLs
-            if sDatafield.startswith("http"):
+            elif sSlot == "url":
                 sURL = sDatafield
-                continue
-            # Otherwise let's hope people used the right order
-            if sOrganisation == "":
-                sOrganisation = sDatafield
-                continue
-            if sCountry == "":
-                sCountry = sDatafield
-                continue
-            if sState == "":
-                sState = sDatafield
-                continue
-            if sCity == "":
-                sCity = sDatafield
-                continue
-        # We now came out of a very long loop checking twiff data letter by letter
-        # If we don't have a city, but do have a state, the state was probs omitted
-        if sState != "" and sCity == "":
-            sCity = sState
-            sState = ""
+            else:
+                # Otherwise let's hope people used the right order
+                for sField in g.text_fields:
+                    if dFields[sField] == "":
+                        dFields[sField] = sDatafield
+                        break
+        # If a field is missing but its fallback is present, the fallback was probs filled in its place
+        # (e.g. we have a state but no city: the state was probs omitted)
+        for sField, sFallback in g.fallbacks.items():
+            if dFields[sFallback] != "" and dFields[sField] == "":
+                dFields[sField] = dFields[sFallback]
+                dFields[sFallback] = ""
         # If no date was found, use tweet date
         if tDate is None:
             tDate = datetime.datetime.strptime(TweetDate, "%Y-%m-%dT%H:%M:%S.000Z")
@@ -307,26 +278,15 @@ class T4FParser(Parser):
                 sURL = QuoteURL
 
         # Clean up locations
-        if "." in sCountry:
-            sCountry = sCountry.split(".")[0]
-        if "." in sState:
-            sState = sState.split(".")[0]
-        if "." in sCity:
-            sCity = sCity.split(".")[0]
+        for sField, sMarker in g.truncate.items():
+            if sMarker in dFields[sField]:
+                dFields[sField] = dFields[sField].split(sMarker)[0]
 
         # We now made the most of the data as we could, let's do some basic checks before reporting
-        if len(sOrganisation) < 3 or len(sOrganisation) > 50 or "http" in sOrganisation:
-            r["errors"] = AddError_v2(r["errors"], "no_org_found")
-        if len(sCountry) < 2 or len(sCountry) > 35 or "http" in sCountry:
-            r["errors"] = AddError_v2(r["errors"], "no_country_found")
-        if len(sState) > 35 or "http" in sState:
-            r["errors"] = AddError_v2(r["errors"], "no_state_found")
-        if len(sCity) > 60 or "http" in sCity:
-            r["errors"] = AddError_v2(r["errors"], "no_city_found")
-        if nPeople == 0:
-            r["errors"] = AddError_v2(r["errors"], "no_people_found")
+        for sError in g.validate(dFields):
+            r["errors"] = AddError_v2(r["errors"], sError)
         # Report back the results
-        dParsed: dict
+        sCountry, sState, sCity = dFields.get("country", ""), dFields.get("state", ""), dFields.get("city", "")
         sFullLocation = sCountry
         if sState != "":
             sFullLocation = sFullLocation + " " + sState
@@ -335,11 +295,11 @@ class T4FParser(Parser):
             r["response"] = "failed"
         else:
             r["response"] = "success"
-        r["data"] = {"num_people": nPeople,
-                     "created_at": tDate.strftime("%d-%m-%Y"),
-                     "organization": sOrganisation,
-                     "location": sFullLocation,
-                     "url": sURL}
+        r.data = TwiffData(num_people=dFields["num_people"],
+                           created_at=tDate.strftime("%d-%m-%Y"),
+                           organization=dFields.get("organization", ""),
+                           location=sFullLocation,
+                           url=sURL)
         return r
 
     def CheckIgnoredUser(self, UserID, users: dict) -> bool:
@@ -367,8 +327,8 @@ class T4FParser(Parser):
             if sEntry != "x":
                 del self.IgnoredUsers[sEntry]
                 self.IgnoredUsers[UserID] = sUserName
-                with open(Path("ignored_users.json"), 'w') as fp:
-                    json.dump(self.IgnoredUsers, fp)
+                if self.PersistIgnoredUsers:
+                    serial.dump(self.IgnoredUsers, Path("ignored_users.json"))
                 return True
         return False
 
@@ -386,7 +346,10 @@ def FindUserNameById_v2(users: dict, userID):
 
     """
 
-    user: dict
+    # Users are keyed by ID in search responses
+    user = users.get(userID)
+    if user is not None and user["id"] == userID:
+        return user["username"]
     for user in users.values():
         if user["id"] == userID:
             return user["username"]
@@ -0,0 +1,98 @@
+import sys
+
+from typing import *
+
+
+class Record:
+    """ Base for compact (`__slots__`) records that keep the dict contract of parsed tweets: fields can be read
+        and written by key, tested with `in`, compared with plain dicts, and converted with `to_dict` at the
+        export boundary.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key:str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key:str, value:Any) -> None:
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key:str) -> bool:
+        return key in self.__slots__
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __eq__(self, other:Any) -> bool:
+        if isinstance(other, (Record, dict)):
+            return to_dict(self) == to_dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(key, getattr(self, key)) for key in self.__slots__))
+
+    def get(self, key:str, default:Optional[Any]=None) -> Any:
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def keys(self) -> Tuple[str,...]:
+        return self.__slots__
+
+    def values(self) -> List[Any]:
+        return [getattr(self, key) for key in self.__slots__]
+
+    def items(self) -> List[Tuple[str,Any]]:
+        return [(key, getattr(self, key)) for key in self.__slots__]
+
+    def to_dict(self) -> Dict[str,Any]:
+        return {key:to_dict(getattr(self, key)) for key in self.__slots__}
+
+
+class TwiffData(Record):
+    __slots__ = ("num_people", "created_at", "organization", "location", "url")
+
+    def __init__(self, num_people:Optional[int]=0, created_at:Optional[str]="", organization:Optional[str]="", location:Optional[str]="", url:Optional[str]="") -> None:
+        self.num_people = num_people
+        self.created_at = created_at
+        self.organization = organization
+        self.location = location
+        self.url = url
+
+
+class ParsedTweet(Record):
+    """ Parsed tweet, see the `Parser` contract. Responses, tweet types and error codes are interned so every
+        record shares a single copy of each string.
+    """
+    __slots__ = ("response", "tweettype", "twiff_id", "quote_id", "data", "errors")
+
+    def __init__(self, response:Optional[str]="failed", tweettype:Optional[str]=None, twiff_id:Optional[str]=None, quote_id:Optional[str]=None,
+                 data:Optional[TwiffData]=None, errors:Optional[List[str]]=None) -> None:
+        self.response = intern(response)
+        self.tweettype = intern(tweettype)
+        self.twiff_id = twiff_id
+        self.quote_id = quote_id
+        self.data = data if data is not None else TwiffData()
+        self.errors = [intern(error) for error in errors] if errors is not None else []
+
+
+def intern(value:Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value is not None else None
+
+
+def to_dict(value:Any) -> Any:
+    """ Converts records (also nested in dicts and lists) to plain dicts, other values are returned as is.
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key:to_dict(val) for (key, val) in value.items()}
+    if isinstance(value, list):
+        return [to_dict(val) for val in value]
+    return value
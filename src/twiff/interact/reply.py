@@ -1,4 +1,3 @@
-import json
 import re
 import logging
 from pathlib import Path
@@ -7,6 +6,8 @@ from typing import *
 
 from abc import ABC, abstractmethod
 
+from twiff.utils import serial
+
 log = logging.getLogger(__name__)
 
 
@@ -16,8 +17,7 @@ class ReplyGenerator(ABC):
 
     def __init__(self, path: str) -> None:
         self.path = Path(path)
-        with open(self.path, 'r') as fp:
-            self.responses = json.load(fp)
+        self.responses = serial.load(self.path)
 
     @abstractmethod
     def __call__(self, parsed_tweet: Dict) -> str:
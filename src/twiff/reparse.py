@@ -0,0 +1,154 @@
+"""
+Offline bulk reparse of the exported tweet archive: re-runs the configured parser over the raw tweets and users
+in the output directory and rewrites parsed-tweets, without making any API call.
+
+"""
+import os
+import logging
+import datetime
+import multiprocessing
+import logging.handlers
+
+from typing import *
+from pathlib import Path
+from argparse import ArgumentParser, Namespace
+
+from twiff import load_module
+from twiff.utils import serial
+from twiff.interact.records import to_dict
+from twiff.utils.io import INDEX, select_partitions, snowflake_id
+
+log = logging.getLogger(__name__)
+
+# Per-process state, set by the pool initializer.
+_parser, _users = None, None
+
+
+def read_items(paths:List[Path]) -> Dict[str,Dict]:
+    """ Reads a chunk of archived items. Each item is a small JSON file, read with a single read call.
+    """
+    items = {}
+    for path in paths:
+        items[path.name.split('.')[0]] = serial.loads(path.read_bytes())
+    return items
+
+
+def list_items(output:Path, subdir:str, start:Optional[datetime.datetime]=None, end:Optional[datetime.datetime]=None) -> List[Path]:
+    root = output.joinpath(subdir)
+    if start is None and end is None:
+        return [p for p in root.rglob("*.json") if p.name != INDEX]
+
+    # Time-range reparse: only the partitions involved, or every file of a flat (unindexed) archive.
+    if root.joinpath(INDEX).exists():
+        paths = [p for partition in select_partitions(output, subdir, start, end) for p in partition.glob("*.json")]
+    else:
+        log.info("No partition index in %s, filtering every item by its creation time.", root)
+        paths = [p for p in root.rglob("*.json") if p.name != INDEX]
+    low = snowflake_id(start) if start is not None else 0
+    high = snowflake_id(end) if end is not None else None
+    return [p for p in paths if int(p.name.split('.')[0]) >= low and (high is None or int(p.name.split('.')[0]) < high)]
+
+
+def _init(config:Dict, users:Dict, records:multiprocessing.Queue, level:int) -> None:
+    global _parser, _users
+    # Worker records go back to the parent's handlers: the queue listener thread of the parent is not forked.
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level)
+    # Only the parent may write ignored_users.json, the workers keep their updates to themselves.
+    _parser = load_module(config, "parser", persist_ignored_users=False)
+    _users = users
+
+
+def _parse_chunk(paths:List[Path]) -> Dict[str,Dict]:
+    parsed_tweets = {}
+    for id_str, tweet in read_items(paths).items():
+        try:
+            parsed_tweets[id_str] = _parser(tweet, _users)
+        except Exception as e:
+            # One malformed archived tweet should not abort a bulk reparse.
+            log.warning("Failed to reparse tweet ID (%s): %r", id_str, e)
+    return parsed_tweets
+
+
+def run(args:Namespace) -> None:
+    '''
+    Streams the tweet archive in chunks through a process pool running the configured parser.
+    '''
+    log.info("Reparse Arguments: %s", args)
+
+    # Configuration
+    config = serial.load(args.config)
+    output = Path(args.output if args.output is not None else config["exporter"]["config"]["output"])
+
+    start = datetime.datetime.fromisoformat(args.start).replace(tzinfo=datetime.timezone.utc) if args.start else None
+    end = datetime.datetime.fromisoformat(args.end).replace(tzinfo=datetime.timezone.utc) if args.end else None
+
+    # Users are needed by every chunk, load them once and hand them to the workers.
+    users = read_items(list_items(output, "users"))
+    paths = list_items(output, "tweets", start, end)
+    chunks = [paths[idx:idx + args.chunk_size] for idx in range(0, len(paths), args.chunk_size)]
+    log.info("Reparsing %d tweets (%d users) in %d chunks over %d processes.", len(paths), len(users), len(chunks), args.processes)
+
+    records = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(records, *logging.getLogger().handlers)
+    listener.start()
+
+    count, success = 0, 0
+    try:
+        with multiprocessing.Pool(args.processes, initializer=_init, initargs=(config, users, records, logging.getLogger().level)) as pool:
+            for parsed_tweets in pool.imap_unordered(_parse_chunk, chunks):
+                load_module(config, "exporter", data={id_str:to_dict(data["data"]) for (id_str, data) in parsed_tweets.items()}, subdir="parsed-tweets")
+                count += len(parsed_tweets)
+                success += sum(data["response"] == "success" for data in parsed_tweets.values())
+            # Let the workers exit (and flush their queued log records) rather than being terminated.
+            pool.close()
+            pool.join()
+    finally:
+        listener.stop()
+
+    log.info("Reparsed %d tweets, %d successfully.", count, success)
+
+
+def get_arg_parser() -> ArgumentParser:
+    '''
+    Argument Parser
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description='Twiff Archive Reparse',
+                                     epilog='Please contact Sam for further help.')
+    parser.add_argument('--config', type=str,
+                        help='Configuration file with the "parser" and "exporter" entries.')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Archive directory, defaults to the exporter output.')
+    parser.add_argument('--start', type=str, default=None,
+                        help='Only reparse tweets created on or after this ISO date (UTC).')
+    parser.add_argument('--end', type=str, default=None,
+                        help='Only reparse tweets created before this ISO date (UTC).')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='Number of parser processes.')
+    parser.add_argument('--chunk_size', type=int, default=1000,
+                        help='Number of tweets per chunk.')
+    return parser
+
+
+def parse_args(args:Optional[Dict[str,Any]]={}) -> Namespace:
+    '''
+    Parse Arguments
+    '''
+    parser = get_arg_parser()
+    parser.set_defaults(**args)
+    args = parser.parse_args([])
+    return args
+
+
+def main(args:Optional[Dict[str,Any]]={}) -> None:
+    '''
+    Entry point.
+    '''
+    args = parse_args(args)
+    run(args)
+
+
+if __name__=='__main__':
+    main()
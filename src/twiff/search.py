@@ -6,19 +6,71 @@ TODO:
 """
 import os
 import sys
-import json
 import tweepy
 import logging
 import datetime
+import itertools
 
 from typing import *
+from pathlib import Path
 from argparse import ArgumentParser, Namespace
 
 from twiff import load_module
+from twiff.utils import serial
+from twiff.utils.budget import prioritise, BudgetShare
+from twiff.utils.accounts import AccountPool
+from twiff.utils.profiling import stage
+from twiff.interact.records import to_dict
 
 log = logging.getLogger(__name__)
 
-def search(client:Any, cursor:str, query:str, max_requests:Optional[int]=10) -> Tuple[Dict, Dict, list, Dict]:
+# Expansions and fields requested for every retrieved tweet (search and stream).
+EXPANSIONS = ['author_id', 'entities.mentions.username', 'geo.place_id', 'in_reply_to_user_id', 'referenced_tweets.id', 'referenced_tweets.id.author_id']
+PLACE_FIELDS = ['country', 'country_code', 'full_name', 'geo', 'id', 'name', 'place_type']
+TWEET_FIELDS = ['author_id', 'conversation_id', 'created_at', 'entities', 'geo', 'id', 'in_reply_to_user_id', 'lang', 'referenced_tweets', 'reply_settings', 'source', 'text', 'withheld']
+USER_FIELDS = ['created_at', 'description', 'entities', 'id', 'location', 'name', 'url', 'username', 'verified', 'withheld']
+
+# Named projections of the above: "minimal" is what the parser and the interaction stages read (check a parser
+# with `twiff.fieldtrace`), "archive" adds what is useful for analysing the exported tweets, "full" is everything.
+FIELD_PROFILES = {
+    "minimal": {"expansions": ['author_id', 'referenced_tweets.id', 'referenced_tweets.id.author_id'],
+                "place_fields": [],
+                "tweet_fields": ['author_id', 'conversation_id', 'created_at', 'entities', 'id', 'referenced_tweets', 'text'],
+                "user_fields": ['id', 'username']},
+    "archive": {"expansions": ['author_id', 'geo.place_id', 'in_reply_to_user_id', 'referenced_tweets.id', 'referenced_tweets.id.author_id'],
+                "place_fields": ['country_code', 'full_name', 'id', 'place_type'],
+                "tweet_fields": ['author_id', 'conversation_id', 'created_at', 'entities', 'geo', 'id', 'in_reply_to_user_id', 'lang', 'referenced_tweets', 'text'],
+                "user_fields": ['created_at', 'id', 'location', 'name', 'username', 'verified']},
+    "full": {"expansions": EXPANSIONS, "place_fields": PLACE_FIELDS, "tweet_fields": TWEET_FIELDS, "user_fields": USER_FIELDS},
+}
+
+
+def field_profile(fields:Optional[Union[str,Dict]]="full", profiles:Optional[Dict[str,Dict]]=None) -> Dict[str,List[str]]:
+    """ Expansions and fields to request.
+
+        Args:
+            fields (Optional[Union[str,Dict]]="full"): Profile name, or a dict with (some of) the "expansions",
+                "place_fields", "tweet_fields" and "user_fields" lists. Missing lists are taken from "full".
+            profiles (Optional[Dict[str,Dict]]=None): Profiles defined in the optional "field-profiles" section of
+                config.json: new profiles, or overrides of (some of) the lists of a `FIELD_PROFILES` profile.
+
+        Returns:
+            fields (Dict[str,List[str]]): The four lists.
+
+        Example::
+            >>> field_profile("minimal")["tweet_fields"]
+            ['author_id', 'conversation_id', 'created_at', 'entities', 'id', 'referenced_tweets', 'text']
+
+    """
+    if isinstance(fields, str):
+        if fields not in FIELD_PROFILES and fields not in (profiles or {}):
+            raise ValueError(f"Unknown field profile: {fields}")
+        fields = {**FIELD_PROFILES.get(fields, {}), **(profiles or {}).get(fields, {})}
+    return {**FIELD_PROFILES["full"], **(fields or {})}
+
+
+def search(client:Any, cursor:str, query:str, max_requests:Optional[int]=10, since_id:Optional[str]=None, until_id:Optional[str]=None,
+           fields:Optional[Union[str,Dict]]="full") -> Tuple[Dict, Dict, list, Dict, Dict]:
     """ Search Tweets
     
         Authentication methods supported: OAuth 2.0 Authorization Code with PKCE
@@ -29,12 +81,16 @@ def search(client:Any, cursor:str, query:str, max_requests:Optional[int]=10) ->
             cursor (str):
             query (str):
             max_requests (Optional[int]=100): 
+            since_id (Optional[str]=None): Lower bound of the ID range searched, e.g. of a worker's shard.
+            until_id (Optional[str]=None): Upper bound of the ID range searched.
+            fields (Optional[Union[str,Dict]]="full"): Field profile, see `field_profile`.
             
         Returns:
             tweets (Dict): 
             users (Dict): 
             errors (list): 
             metadata (Dict): 
+            referenced (Dict): Tweets referenced (e.g. quoted) by the retrieved tweets, from the includes. Key=tweet_id.
             
         Example::
             >>>
@@ -42,22 +98,26 @@ def search(client:Any, cursor:str, query:str, max_requests:Optional[int]=10) ->
             >>>
             
     """
-    tweets, users, errors, metadata = {}, {}, [], {}
+    tweets, users, errors, metadata, referenced = {}, {}, [], {}, {}
     
     # Prepare cursors for retrieving tweets.
     from twiff.utils.cursor import Cursor
     new_cursor = Cursor()
     old_cursor = Cursor(cursor)
     
-    # Search for tweets
+    # Search for tweets, resuming from the cursor within the (optional) ID range
+    if since_id is None or (old_cursor._newest_id() is not None and int(old_cursor._newest_id()) > int(since_id)):
+        since_id = old_cursor._newest_id()
+    # Empty lists are left out of the request rather than sent as empty parameters
+    fields = field_profile(fields)
     responses = client.search_recent_tweets(query=query, 
-                                            expansions=['author_id', 'entities.mentions.username', 'geo.place_id', 'in_reply_to_user_id', 'referenced_tweets.id', 'referenced_tweets.id.author_id'],
+                                            expansions=fields["expansions"] or None,
                                             max_results=max_requests, 
-                                            place_fields=['country', 'country_code', 'full_name', 'geo', 'id', 'name', 'place_type'],
-                                            since_id=old_cursor._newest_id(),
-                                            tweet_fields=['author_id', 'conversation_id', 'created_at', 'entities', 'geo', 'id', 'in_reply_to_user_id', 'lang', 'referenced_tweets', 'reply_settings', 'source', 'text', 'withheld'],
-                                            until_id=new_cursor._oldest_id(),
-                                            user_fields=['created_at', 'description', 'entities', 'id', 'location', 'name', 'url', 'username', 'verified', 'withheld']
+                                            place_fields=fields["place_fields"] or None,
+                                            since_id=since_id,
+                                            tweet_fields=fields["tweet_fields"] or None,
+                                            until_id=until_id if until_id is not None else new_cursor._oldest_id(),
+                                            user_fields=fields["user_fields"] or None
                                            )
 
     # Process tweet data
@@ -67,8 +127,12 @@ def search(client:Any, cursor:str, query:str, max_requests:Optional[int]=10) ->
     
     # Process user data
     if 'includes' in responses:
-        for user in responses['includes']['users']:
+        for user in responses['includes'].get('users', []):
             users[user['id']] = user
+    
+    # Index referenced tweets, so quotes resolve by id
+    if 'includes' in responses:
+        referenced = referenced_index(responses['includes'])
 
     # Process error data
     if 'errors' in responses:
@@ -83,12 +147,80 @@ def search(client:Any, cursor:str, query:str, max_requests:Optional[int]=10) ->
         new_cursor._update(metadata['oldest_id'], metadata['newest_id'])
         new_cursor._dump(cursor)
     
-    log.info(f"Retrieved {len(tweets)} tweets and {len(users)} associated users. Encountered {len(errors)} errors.")
+    log.info("Retrieved %d tweets, %d referenced tweets and %d associated users. Encountered %d errors.", len(tweets), len(referenced), len(users), len(errors))
             
-    return tweets, users, errors, metadata
+    return tweets, users, errors, metadata, referenced
+
+
+def referenced_index(includes:Dict) -> Dict[str,Dict]:
+    """ Index of the referenced tweets in the includes of a search or stream response (`referenced_tweets.id`
+        expansion), with their author (`referenced_tweets.id.author_id`) in the included users.
+
+        Args:
+            includes (Dict): Response includes.
+
+        Returns:
+            referenced (Dict): Referenced tweets, Key=tweet_id.
+
+    """
+    return {tweet['id']:tweet for tweet in includes.get('tweets', [])}
+
+
+def processed_quotes(tweets:Dict, parsed_tweets:Dict, output:Optional[str]=None) -> List[str]:
+    """ Tweets quoting a twiff that was parsed successfully, either in this batch or (if it is marked as processed
+        in `output`, see `process`) by an earlier run. Such quotes report an action that is already accounted for.
+        Quotes of tweets that failed to parse (e.g. a correction of one's own malformed twiff) are not included.
+
+        Args:
+            tweets (Dict): Tweets, Key=tweet_id.
+            parsed_tweets (Dict): Parsed tweets of this batch, Key=tweet_id.
+            output (Optional[str]=None): Exporter output directory.
+
+        Returns:
+            ids (List[str]): IDs of the quoting tweets.
+
+    """
+    from twiff.utils.io import find_item
+    ids = []
+    for id_str, tweet in tweets.items():
+        for rft in tweet.get("referenced_tweets", []):
+            if rft["type"] == "quoted":
+                parsed_tweet = parsed_tweets.get(rft["id"])
+                if parsed_tweet is not None:
+                    if parsed_tweet["response"] == "success" and parsed_tweet["twiff_id"] is not None:
+                        ids.append(id_str)
+                elif output is not None and find_item(output, rft["id"], subdir="processed") is not None:
+                    ids.append(id_str)
+                break
+    return ids
                        
     
-def parse(tweets:Dict, users:Dict, parser:Callable) -> Dict:
+def quoted_usernames(tweets:Dict, referenced:Optional[Dict]=None) -> List[str]:
+    """ Usernames of the authors of quoted tweets, taken from the quoted tweet URL as the parser does. Authors of
+        indexed (referenced) tweets are left out, they come with the response includes.
+
+        Args:
+            tweets (Dict): Tweets, Key=tweet_id.
+            referenced (Optional[Dict]=None): Referenced tweet index, see `referenced_index`.
+
+        Returns:
+            usernames (List[str]): Usernames of quoted tweet authors.
+
+    """
+    usernames = []
+    for tweet in tweets.values():
+        for rft in tweet.get("referenced_tweets", []):
+            if rft["type"] == "quoted":
+                if referenced is not None and rft["id"] in referenced:
+                    break
+                for url in tweet.get("entities", {}).get("urls", []):
+                    if rft["id"] in str(url["expanded_url"]):
+                        usernames.append(url["expanded_url"].split("/")[3])
+                break
+    return usernames
+
+
+def parse(tweets:Dict, users:Dict, parser:Callable, referenced:Optional[Dict]=None) -> Dict:
     """ Handles parsing of tweets using the provided tweet parsing method.
     
         NOTE: 
@@ -98,6 +230,7 @@ def parse(tweets:Dict, users:Dict, parser:Callable) -> Dict:
         Args:
             tweets (Dict):
             tweet_parser (Callable): 
+            referenced (Optional[Dict]=None): Referenced tweet index, see `referenced_index`.
             
         Returns:
             parsed_tweets (Dict): Dictionary containing parsed tweets. Key=tweet_id, Values=...
@@ -109,13 +242,176 @@ def parse(tweets:Dict, users:Dict, parser:Callable) -> Dict:
     """
     parsed_tweets = {}
     for idx, (id_str, tweet) in enumerate(tweets.items()):
-        parsed_tweets[id_str] = parser(tweet, users)
-    log.info(f"Successfully parsed {len([None for val in parsed_tweets.values() if val is not None])} tweets out of {len(tweets)}.")
+        parsed_tweets[id_str] = parser(tweet, users, referenced=referenced)
+    log.info("Successfully parsed %d tweets out of %d.", sum(val is not None for val in parsed_tweets.values()), len(tweets))
         
     return parsed_tweets
 
 
-def like(client:Any, parsed_tweets:Dict, condition:Callable, max_requests:Optional[int]=10) -> None:
+def interact(client:Any, action:str, tweet_id:str, text:Optional[str]=None) -> Any:
+    """ Sends a single interaction (like, retweet or reply) for the given tweet id.
+
+        Args:
+            client (tweepy.Client): Registered and authenticated client.
+            action (str): One of "like", "retweet" or "reply".
+            tweet_id (str): ID of the tweet to interact with.
+            text (Optional[str]=None): Reply text, only used for "reply".
+
+        Returns:
+            response (Dict): API response.
+
+    """
+    if action == "like":
+        return client.like(tweet_id)
+    elif action == "retweet":
+        return client.retweet(tweet_id)
+    elif action == "reply":
+        return client.create_tweet(in_reply_to_tweet_id=tweet_id, text=text)
+    raise ValueError(f"Unknown interaction: {action}")
+
+
+def rejected(error:Exception) -> bool:
+    """ Whether the API rejected an interaction for good (400 bad request, 403 forbidden, 404 not found), so
+        retrying it can never succeed. Rate limits (429), authentication (401) and server errors are transient.
+    """
+    from tweepy.errors import BadRequest, Forbidden, NotFound
+    return isinstance(error, (BadRequest, Forbidden, NotFound))
+
+
+def dispatch(client:Any, action:str, targets:List[Dict], journal:Optional[Any]=None, account:Optional[str]=None) -> int:
+    """ Sends a batch of interactions of a single type, recording them in the write-ahead journal.
+
+        All interactions are journalled as planned (one fsync) before the first API call goes out, and each
+        is journalled as done (one fsync) as soon as its call returned, so a crash mid-batch only replays the
+        interactions that were not sent. Interactions the API rejects for good (see `rejected`) are journalled
+        as done with the error and the batch continues. On a transient failure (rate limit, server error) the
+        rest of the batch is left pending in the journal for `replay`.
+
+        Args:
+            client (tweepy.Client): Registered and authenticated client.
+            action (str): One of "like", "retweet" or "reply".
+            targets (List[Dict]): Interactions to send, each with an "id" and optionally a reply "text".
+            journal (Optional[Journal]=None): Write-ahead journal, interactions are not recorded if None.
+            account (Optional[str]=None): Name of the account sending the interactions, recorded for replay.
+
+        Returns:
+            success (int): Number of interactions sent.
+
+    """
+    from tweepy.errors import HTTPException
+
+    if journal is not None:
+        for target in targets:
+            journal.plan(action, target["id"], account=account, **{k:v for (k, v) in target.items() if k != "id"})
+        journal.flush()
+
+    success = 0
+    for (idx, target) in enumerate(targets):
+        try:
+            interact(client, action, target["id"], target.get("text"))
+        except HTTPException as e:
+            if not rejected(e):
+                log.warning("Failed to %s tweet ID (%s), leaving %d interactions pending: %s", action, target['id'], len(targets) - idx, e)
+                break
+            log.warning("Rejected %s for tweet ID (%s): %s", action, target['id'], e)
+            if journal is not None:
+                journal.done(action, target["id"], error=str(e))
+                journal.flush()
+            continue
+        success += 1
+        if journal is not None:
+            journal.done(action, target["id"])
+            journal.flush()
+    return success
+
+
+def replay(accounts:Any, journal:Any, leases:Optional[Any]=None) -> int:
+    """ Replays interactions that were planned but never completed by a previous (crashed) run.
+
+        Interactions the API rejects for good (see `rejected`, e.g. an already sent duplicate reply or a
+        deleted tweet) are journalled as done with the error, a transient failure leaves the interaction pending
+        for the next run. With leases, interactions planned by a run that is still alive are left to it.
+
+        Args:
+            accounts (AccountPool): Accounts, each interaction is replayed by the account that planned it.
+            journal (Journal): Write-ahead journal.
+            leases (Optional[LeaseManager]=None): Leases of concurrent runs, every pending interaction is replayed if None.
+
+        Returns:
+            success (int): Number of interactions replayed.
+
+    """
+    from tweepy.errors import HTTPException
+
+    success = 0
+    for record in journal.pending():
+        if leases is not None and record.get("owner") is not None and leases.alive(record["owner"]):
+            continue
+        try:
+            interact(accounts.get(record.get("account")).client, record["action"], record["id"], record.get("text"))
+            journal.done(record["action"], record["id"])
+            success += 1
+        except HTTPException as e:
+            if not rejected(e):
+                log.warning("Failed to replay journalled %s for tweet ID (%s): %s", record['action'], record['id'], e)
+                continue
+            log.info("Journalled %s for tweet ID (%s) was rejected, dropping it: %s", record['action'], record['id'], e)
+            journal.done(record["action"], record["id"], error=str(e))
+        journal.flush()
+    log.info("Replayed %d journalled interactions.", success)
+    return success
+
+
+def allowance(action:str, max_requests:Optional[int], budget:Optional[Any]=None) -> int:
+    """ Number of interactions of the given type that may be sent this run: max_requests, capped by what is left
+        of the current rate-limit window in the budget ledger (if provided).
+    """
+    if budget is None:
+        return max_requests or 0
+    return budget.allowance(action, max_requests)
+
+
+def schedule(action:str, parsed_tweets:Dict, targets_for:Callable, limit:int, backlog:Optional[Any]=None, account:Optional[str]=None) -> List[Dict]:
+    """ Selects the interactions to send this run, at most `limit`.
+
+        Tweets queued in the backlog by previous runs are considered first, followed by the freshly parsed
+        tweets. Tweets whose interactions do not fit in the limit are queued in the backlog for the next run
+        rather than dropped. Queued tweets are claimed by this run (see `Backlog.pending`), so concurrent runs
+        never schedule the same ones.
+
+        Args:
+            action (str): One of "like", "retweet" or "reply".
+            parsed_tweets (Dict): Parsed tweets, Key=tweet_id.
+            targets_for (Callable): Returns the list of interactions (see `dispatch`) required for a parsed tweet.
+            limit (int): Maximum number of interactions.
+            backlog (Optional[Backlog]=None): Persistent queue of leftover tweets.
+            account (Optional[str]=None): Name of the sending account, each account has its own queue.
+
+        Returns:
+            targets (List[Dict]): Interactions to dispatch.
+
+    """
+    queue = action if account is None else f"{action}/{account}"
+    pending = backlog.pending(queue) if backlog is not None else {}
+    candidates = {**pending, **{id_str:parsed_tweet for (id_str, parsed_tweet) in parsed_tweets.items() if id_str not in pending}}
+
+    targets, taken, leftover = [], [], {}
+    for idx, (id_str, parsed_tweet) in enumerate(candidates.items()):
+        tweet_targets = targets_for(id_str, parsed_tweet)
+        if len(targets) + len(tweet_targets) > limit:
+            leftover[id_str] = parsed_tweet
+            continue
+        targets.extend(tweet_targets)
+        taken.append(id_str)
+
+    if backlog is not None:
+        backlog.update(queue, done=taken, queued=leftover)
+    elif leftover:
+        log.info("Dropped %d tweets over the %s limit.", len(leftover), action)
+    return targets
+
+
+def like(client:Any, parsed_tweets:Dict, condition:Callable, max_requests:Optional[int]=10, journal:Optional[Any]=None, budget:Optional[Any]=None, backlog:Optional[Any]=None, account:Optional[str]=None) -> None:
     """ Likes tweets using associated tweet id.
 
         Using max_likes may be necessary depending on whether you can afford to respect wait limits for all retrieved tweets.
@@ -133,21 +429,18 @@ def like(client:Any, parsed_tweets:Dict, condition:Callable, max_requests:Option
             X
 
     """
+    def targets_for(id_str:str, parsed_tweet:Dict) -> List[Dict]:
+        # if condition(tweet): // Removed, parser handles the conditions
+        return [{"id": parsed_tweet[key]} for key in ("twiff_id", "quote_id") if parsed_tweet[key] is not None]
+
+    targets = []
     if max_requests:
-        success = 0
-        for idx, (id_str, parsed_tweet) in enumerate(parsed_tweets.items()):
-            if parsed_tweet["twiff_id"] is not None:
-                # if condition(tweet): // Removed, parser handles the conditions
-                client.like(parsed_tweet["twiff_id"])
-                success += 1
-            if parsed_tweet["quote_id"] is not None:
-                client.like(parsed_tweet["quote_id"])
-                success += 1
-            if success >= max_requests: break
-    log.info(f"Liked {success} tweets.")
-
-
-def retweet(client:Any, parsed_tweets:Dict, condition:Callable, max_requests:Optional[int]=10) -> None:
+        targets = schedule("like", parsed_tweets, targets_for, allowance("like", max_requests, budget), backlog, account)
+    success = dispatch(client, "like", targets, journal, account)
+    log.info("Liked %d tweets.", success)
+
+
+def retweet(client:Any, parsed_tweets:Dict, condition:Callable, max_requests:Optional[int]=10, journal:Optional[Any]=None, budget:Optional[Any]=None, backlog:Optional[Any]=None, account:Optional[str]=None) -> None:
     """ Retweets tweets using associated tweet id.
 
         Using max_retweets may be necessary depending on whether you can afford to respect wait limits for all retrieved tweets.
@@ -165,21 +458,18 @@ def retweet(client:Any, parsed_tweets:Dict, condition:Callable, max_requests:Opt
             X
 
     """
+    def targets_for(id_str:str, parsed_tweet:Dict) -> List[Dict]:
+        # if condition(parsed_tweet) is not None: // Removed, parser handles the conditions
+        return [{"id": parsed_tweet[key]} for key in ("twiff_id", "quote_id") if parsed_tweet[key] is not None]
+
+    targets = []
     if max_requests:
-        success = 0
-        for idx, (id_str, parsed_tweet) in enumerate(parsed_tweets.items()):
-            if parsed_tweet["twiff_id"] is not None:
-                # if condition(parsed_tweet) is not None: // Removed, parser handles the conditions
-                client.retweet(parsed_tweet["twiff_id"])
-                success += 1
-            if parsed_tweet["quote_id"] is not None:
-                client.retweet(parsed_tweet["quote_id"])
-                success += 1
-            if success >= max_requests: break
-    log.info(f"Retweeted {success} tweets.")
+        targets = schedule("retweet", parsed_tweets, targets_for, allowance("retweet", max_requests, budget), backlog, account)
+    success = dispatch(client, "retweet", targets, journal, account)
+    log.info("Retweeted %d tweets.", success)
             
     
-def reply(client:Any, parsed_tweets:Dict, generator:Callable, max_requests:Optional[int]=10) -> None:
+def reply(client:Any, parsed_tweets:Dict, generator:Callable, max_requests:Optional[int]=10, journal:Optional[Any]=None, budget:Optional[Any]=None, backlog:Optional[Any]=None, account:Optional[str]=None, output:Optional[str]=None) -> None:
     """ Replies to the author of the parsed tweet as dictated by the provided response_generator.
         
         Authentication methods supported: OAuth 2.0 Authorization Code with PKCE
@@ -196,6 +486,12 @@ def reply(client:Any, parsed_tweets:Dict, generator:Callable, max_requests:Optio
                     organization (str):
                     location (str): 
             response_generator (Callable): Callable function to generate response based on parsed tweet data.
+            journal (Optional[Journal]=None): Write-ahead journal for sent replies.
+            budget (Optional[Budget]=None): Rate-limit ledger capping max_requests by the remaining window.
+            backlog (Optional[Backlog]=None): Queue of tweets left over from previous runs, drained first.
+            account (Optional[str]=None): Name of the account the client belongs to.
+            output (Optional[str]=None): Exporter output directory of the campaign, tweets exported there by
+                previous runs are not replied to again. No tweet is considered processed if None.
             
         Returns:
             None
@@ -207,79 +503,228 @@ def reply(client:Any, parsed_tweets:Dict, generator:Callable, max_requests:Optio
             
     """
     # TODO: Replying to tweets needs persistent memory of replied-to tweets, can't get this from API easily to use filesystem.
-    from pathlib import Path
-    path = "/home/deploy/gamechanger/twiff/output/tweets"
-    ids = [p.name.split('.')[0] for p in Path(path).glob("*.json")] if Path(path).exists() else []
+    from twiff.utils.io import find_item
+    ids = set(id_str for id_str in parsed_tweets if find_item(output, id_str, subdir="tweets") is not None) if output is not None else set()
     
+    # Queued tweets were exported by the run that queued them, they are not processed yet.
+    queued = set(backlog.pending("reply" if account is None else f"reply/{account}")) if backlog is not None else set()
+    
+    def targets_for(id_str:str, parsed_tweet:Dict) -> List[Dict]:
+        if id_str in ids and id_str not in queued:
+            log.info("Tweet ID (%s) has already been processed.", id_str)
+            return []
+        if parsed_tweet['response'] == "success":
+            response = generator(parsed_tweet)
+            if response is not None:
+                return [{"id": id_str, "text": response}]
+        return []
+
+    targets = []
     if max_requests:
-        success = 0
-        for idx, (id_str, parsed_tweet) in enumerate(parsed_tweets.items()):
-            if id_str not in ids:
-                if parsed_tweet['response'] == "success":
-                    response = generator(parsed_tweet)
-                    if response is not None:
-                        client.create_tweet(in_reply_to_tweet_id=id_str, text=response)
-                        success += 1
-            else:
-                log.info(f"Tweet ID ({id_str}) has already been processed.")
-            if success >= max_requests: break
-    log.info(f"Replied to {success} tweets.")
+        targets = schedule("reply", parsed_tweets, targets_for, allowance("reply", max_requests, budget), backlog, account)
+    success = dispatch(client, "reply", targets, journal, account)
+    log.info("Replied to %d tweets.", success)
 
 
-def run(args:Namespace) -> None:
+def setup_shared(config:Dict) -> Dict[str,Any]:
     '''
-    
+    Loads the resources shared by every cycle and campaign: accounts with their clients (connection pools) and
+    budget ledgers, user directory, journal (replaying interactions left incomplete by a previous run) and leases.
     '''
-    # Log
-    log.info(f"Search Arguments: {args}")
-    
-    # Configuration
-    with open(args.config, 'r') as fp:
-        config = json.load(fp)
-    
-    # API Keys
-    if os.getenv("TWITTER_API_KEYS_FILE", None) is not None:
-        keys = {}
-        with open(os.getenv("TWITTER_API_KEYS_FILE", None), "r") as fp:
-            for line in fp.readlines():
-                key, val = line.split("=")
-                keys[key] = val.strip()
-    else:
-        raise ValueError(f"No API_KEYS file provided in environment variables. User should implement a method here to read keys from args.")
-    
-    # Initialise tweepy client
-    from tweepy import Client
-    client = Client(
-        keys['BEARER_TOKEN'], 
-        keys['API_KEY'], keys['API_KEY_SECRET'], 
-        keys['ACCESS_TOKEN'], keys['ACCESS_TOKEN_SECRET'], 
-        return_type=dict, wait_on_rate_limit=True
-    )
-    log.info(f"User Agent: {client.user_agent}")
+    # Accounts: defaults to the single account in TWITTER_API_KEYS_FILE
+    accounts = load_module(config, "accounts")
+    if accounts is None:
+        accounts = AccountPool(keys={"default": os.getenv("TWITTER_API_KEYS_FILE", None)})
+        accounts["default"].attach(load_module(config, "budget"))
+    
+    # Searches are app-wide, use the first account's client
+    client = next(iter(accounts)).client
+    log.info("User Agent: %s", client.user_agent)
+    
+    # Users seen by previous runs
+    directory = load_module(config, "users")
     
     # Print Authenticated User
-    user = client.get_user(username="twiff_bot")['data']
-    log.info(f"Authenticated User: [ {user['name']} ] {user['username']} (ID={user['id']})")
+    user = directory.get_by_name("twiff_bot") if directory is not None else None
+    if user is None:
+        user = client.get_user(username="twiff_bot")['data']
+        if directory is not None:
+            directory.update({user['id']: user})
+    log.info("Authenticated User: [ %s ] %s (ID=%s)", user.get('name'), user['username'], user['id'])
     
-    # Perform search using provided query.
-    tweets, users, errors, metadata = search(client=client, max_requests=args.max_requests, **config['search']['config'])
-       
-    # Attempt to parse tweets using provided method: parse according to pre-determined format
-    parsed_tweets = parse(tweets=tweets, users=users, parser=load_module(config, "parser"))
+    # Coordination with concurrent runs and other nodes
+    leases = load_module(config, "leases")
+    
+    # Replay interactions left incomplete by a previous run, one run at a time: the journal lease
+    journal = load_module(config, "journal", owner=leases.owner) if leases is not None else load_module(config, "journal")
+    if journal is not None and (leases is None or leases.acquire(str(journal.path))):
+        replay(accounts=accounts, journal=journal, leases=leases)
+        if leases is not None:
+            leases.release(str(journal.path))
+    
+    return {"accounts": accounts, "client": client, "directory": directory, "journal": journal, "leases": leases}
+
+
+def setup_campaign(config:Dict, shared:Dict[str,Any], name:Optional[str]=None) -> Dict[str,Any]:
+    '''
+    Loads the resources of a campaign on top of the shared ones: its backlog, parser, conditions and reply generator.
+    Searches, cursors and exporters are taken from the campaign configuration.
+    '''
+    return {**shared, "config": config, "name": config.get("name", name),
+            # Tweets left over by previous runs
+            "backlog": load_module(config, "backlog"),
+            "parser": load_module(config, "parser"),
+            "like-condition": load_module(config, "like-condition"),
+            "retweet-condition": load_module(config, "retweet-condition"),
+            "reply-generator": load_module(config, "reply-generator"),
+            # Upload of parsed actions to the map backend
+            "uploader": load_module(config, "uploader")}
+
+
+def setup(args:Namespace) -> Dict[str,Any]:
+    '''
+    Loads the configuration and the resources of a single campaign, see `setup_shared` and `setup_campaign`.
+    '''
+    config = serial.load(args.config)
+    return setup_campaign(config, setup_shared(config), name=Path(args.config).stem)
 
-    # Like retrieved tweets: like parsed tweets
-    like(client=client, parsed_tweets=parsed_tweets, condition=load_module(config, "like-condition"), max_requests=args.max_requests)
 
-    # Retweet retrieved tweets: retweet parsed tweets
-    retweet(client=client, parsed_tweets=parsed_tweets, condition=load_module(config, "retweet-condition"), max_requests=args.max_requests)
+def process(context:Dict[str,Any], args:Namespace, tweets:Dict, users:Dict, referenced:Optional[Dict]=None, share:Optional[int]=1) -> Dict:
+    '''
+    Runs retrieved tweets through the parse, interaction and export stages. With `share` > 1 only that fraction
+    (1/share) of what is left of each rate limit is spent, leaving the rest to the campaigns scheduled after this one.
+    '''
+    config, accounts, client, directory = context["config"], context["accounts"], context["client"], context["directory"]
+    
+    # Resolve authors of quoted tweets missing from the search includes
+    if directory is not None:
+        directory.update(users)
+        users.update(directory.resolve(client, quoted_usernames(tweets, referenced)))
+    
+    # Attempt to parse tweets using provided method: parse according to pre-determined format
+    with stage("parse", args.profile):
+        parsed_tweets = parse(tweets=tweets, users=users, parser=context["parser"], referenced=referenced)
     
-    # Reply to parsed tweets using generated response: reply to all tweets with different responses
-    reply(client=client, parsed_tweets=parsed_tweets, generator=load_module(config, "reply-generator"), max_requests=args.max_requests)
+    # Quotes of twiffs that are processed themselves report the same action: parsed and exported, but neither
+    # interacted with nor uploaded
+    output = config.get("exporter", {}).get("config", {}).get("output")
+    skipped = set(processed_quotes(tweets, parsed_tweets, output))
+    if skipped:
+        log.info("Skipping interactions with %d tweets quoting already processed tweets.", len(skipped))
+    
+    # Spend the remaining budget on the most valuable interactions first
+    actions = prioritise({id_str:parsed_tweet for (id_str, parsed_tweet) in parsed_tweets.items() if id_str not in skipped})
+    
+    # Shard interactions over the accounts, keeping each conversation on one account
+    shards = accounts.split(actions, shard_keys={id_str:tweet.get("conversation_id", id_str) for (id_str, tweet) in tweets.items()})
+    
+    for account in accounts:
+        shard = shards[account.name]
+        budget = BudgetShare(account.budget, share) if account.budget is not None and share > 1 else account.budget
+        
+        # Like retrieved tweets: like parsed tweets
+        with stage("like", args.profile):
+            like(client=account.client, parsed_tweets=shard, condition=context["like-condition"], max_requests=args.max_requests, journal=context["journal"], budget=budget, backlog=context["backlog"], account=account.name)
+        
+        # Retweet retrieved tweets: retweet parsed tweets
+        with stage("retweet", args.profile):
+            retweet(client=account.client, parsed_tweets=shard, condition=context["retweet-condition"], max_requests=args.max_requests, journal=context["journal"], budget=budget, backlog=context["backlog"], account=account.name)
+        
+        # Reply to parsed tweets using generated response: reply to all tweets with different responses
+        with stage("reply", args.profile):
+            reply(client=account.client, parsed_tweets=shard, generator=context["reply-generator"], max_requests=args.max_requests, journal=context["journal"], budget=budget, backlog=context["backlog"], account=account.name, output=output)
+        
+        # Persist the rate-limit ledger
+        if account.budget is not None:
+            account.budget.close()
     
     # Export/dump data to disk for longer-term storage.
-    load_module(config, "exporter", data={id_str:tweet for (id_str, tweet) in tweets.items()}, subdir="tweets")
-    load_module(config, "exporter", data={id_str:user for (id_str, user) in users.items()}, subdir="users")
-    load_module(config, "exporter", data={id_str:data["data"] for (id_str, data) in parsed_tweets.items()}, subdir="parsed-tweets")
+    with stage("export", args.profile):
+        load_module(config, "exporter", data={id_str:tweet for (id_str, tweet) in tweets.items()}, subdir="tweets")
+        load_module(config, "exporter", data={id_str:user for (id_str, user) in users.items()}, subdir="users")
+        load_module(config, "exporter", data={id_str:to_dict(data["data"]) for (id_str, data) in parsed_tweets.items()}, subdir="parsed-tweets")
+        # Success markers: quotes of these tweets in later runs are skipped, see `processed_quotes`
+        load_module(config, "exporter", data={id_str:{"twiff_id": data["twiff_id"]} for (id_str, data) in parsed_tweets.items()
+                                              if data["response"] == "success" and data["twiff_id"] is not None}, subdir="processed")
+        if context["uploader"] is not None:
+            context["uploader"].upload(actions)
+    
+    return parsed_tweets
+
+
+def teardown(context:Dict[str,Any], keys:Optional[Iterable[str]]=("journal", "backlog", "uploader", "directory", "leases")) -> None:
+    '''
+    Drops completed interactions from the journal, persists the backlog and user directory, sends what is left in
+    the upload spool and releases leases.
+    '''
+    for key in keys:
+        if context[key] is not None:
+            context[key].close()
+
+
+def shards(search_config:Dict) -> List[Dict]:
+    '''
+    Search windows of the "search" configuration: one per entry of its optional "shards" list (each overriding
+    e.g. "query", "cursor", "since_id" or "until_id"), else the configuration itself. Every shard needs its own cursor.
+    '''
+    base = {key:val for (key, val) in search_config.items() if key != "shards"}
+    return [{**base, **shard} for shard in search_config.get("shards", [])] or [base]
+
+
+def run(args:Namespace) -> None:
+    '''
+    Runs one or more campaigns (a configuration file each) in one process, sharing the accounts, clients and
+    rate-limit ledgers of the first. The campaigns' shards are scheduled round-robin and each gets an equal share
+    of what is left of the rate limits.
+    
+    Every shard (query or ID range) is only searched if this run acquires its lease, so overlapping runs and
+    workers on other nodes split the shards between them instead of searching and answering the same tweets twice.
+    '''
+    # Log
+    log.info("Search Arguments: %s", args)
+    
+    paths = args.config if isinstance(args.config, list) else [args.config]
+    configs = [serial.load(path) for path in paths]
+    shared = setup_shared(configs[0])
+    campaigns = [setup_campaign(config, shared, name=Path(path).stem) for (path, config) in zip(paths, configs)]
+    leases = shared["leases"]
+    
+    # Fair scheduling: one shard of every campaign per round
+    rounds = itertools.zip_longest(*[[(context, shard) for shard in shards(context["config"]['search']['config'])] for context in campaigns])
+    queue = [item for items in rounds for item in items if item is not None]
+    
+    # Searches are app-wide, accounted on the ledger of the shared client
+    search_budget = next(iter(shared["accounts"])).budget
+    
+    try:
+        for idx, (context, shard) in enumerate(queue):
+            config = context["config"]
+            shard["fields"] = field_profile(shard.get("fields", "full"), config.get("field-profiles"))
+        
+            if not allowance("search", 1, search_budget):
+                log.warning("Search rate limit exhausted, skipping campaign %s (%s).", context["name"], shard["query"])
+                continue
+        
+            # The shard's cursor names its search window
+            if leases is not None and not leases.acquire(shard["cursor"]):
+                continue
+        
+            # Perform search using provided query.
+            with stage("search", args.profile):
+                tweets, users, errors, metadata, referenced = search(client=context["client"], max_requests=args.max_requests, **shard)
+        
+            # The lease expired during the search (ttl shorter than a run) and another worker may be searching the
+            # same window: skip interacting rather than risk answering tweets twice.
+            if leases is not None and not leases.renew(shard["cursor"]):
+                continue
+            process(context, args, tweets, users, referenced, share=len(queue) - idx)
+        
+            if leases is not None:
+                leases.release(shard["cursor"])
+    finally:
+        for context in campaigns:
+            teardown(context, keys=("backlog", "uploader"))
+        teardown(shared, keys=("journal", "directory", "leases"))
     
     
 def get_arg_parser() -> ArgumentParser:
@@ -290,9 +735,11 @@ def get_arg_parser() -> ArgumentParser:
     parser = argparse.ArgumentParser(description='Twitter Search', 
                                      epilog='Please contact Sam for further help.')    
     parser.add_argument('--config', type=str,
-                        help='Configuration file for running the job.') 
+                        help='Configuration file for running the job, or a list of them (one per campaign).') 
     parser.add_argument('--max_requests', type=int, default=None,
                         help='Maximum number of requests.')   
+    parser.add_argument('--profile', type=serial.loads, default=None,
+                        help='Profiling configuration {"output": dir, "stage": name}, disabled if not set.')
     return parser
 
 
@@ -0,0 +1,215 @@
+"""
+Push-based ingestion from the v2 filtered stream: tweets matching the configured query are sent through the
+parse, interaction and export stages of `twiff.search` as they arrive, instead of polling recent search.
+
+"""
+import time
+import logging
+
+from typing import *
+from argparse import ArgumentParser, Namespace
+
+import requests
+
+from twiff.search import setup, process, teardown, search, shards, field_profile, referenced_index
+from twiff.utils.cursor import Cursor
+from twiff.utils import serial
+
+log = logging.getLogger(__name__)
+
+
+class StreamClient:
+    """ Minimal filtered stream client: rule management and a reconnecting line reader.
+
+        The host is configurable so the stream can be exercised against a local stand-in server.
+
+        Args:
+            bearer_token (str): App bearer token.
+            url (Optional[str]="https://api.twitter.com"): API host.
+            timeout (Optional[int]=30): Read timeout in seconds, the API sends a keep-alive every 20 seconds.
+            fields (Optional[Union[str,Dict]]="full"): Field profile, see `twiff.search.field_profile`.
+
+        Example::
+            >>> stream = StreamClient(keys["BEARER_TOKEN"])
+            >>> stream.sync_rules("(#twiff OR #Twiff) -is:retweet", tag="twiff")
+            >>> for message in stream.messages():
+            >>>     ...
+    """
+
+    def __init__(self, bearer_token:str, url:Optional[str]="https://api.twitter.com", timeout:Optional[int]=30, fields:Optional[Union[str,Dict]]="full") -> None:
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.fields = field_profile(fields)
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {bearer_token}"
+
+    def get_rules(self) -> List[Dict]:
+        response = self.session.get(f"{self.url}/2/tweets/search/stream/rules", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json().get("data", [])
+
+    def sync_rules(self, query:str, tag:Optional[str]="twiff") -> None:
+        """ Makes the configured query the only stream rule, leaving it untouched if it already is.
+        """
+        rules = self.get_rules()
+        stale = [rule["id"] for rule in rules if rule["value"] != query]
+        if stale:
+            response = self.session.post(f"{self.url}/2/tweets/search/stream/rules", json={"delete": {"ids": stale}}, timeout=self.timeout)
+            response.raise_for_status()
+            log.info("Deleted %d stale stream rules.", len(stale))
+        if not any(rule["value"] == query for rule in rules):
+            response = self.session.post(f"{self.url}/2/tweets/search/stream/rules", json={"add": [{"value": query, "tag": tag}]}, timeout=self.timeout)
+            response.raise_for_status()
+            log.info("Added stream rule: %s", query)
+
+    def connect(self, on_connect:Optional[Callable]=None) -> Iterator[Dict]:
+        params = {"expansions": ",".join(self.fields["expansions"]),
+                  "place.fields": ",".join(self.fields["place_fields"]),
+                  "tweet.fields": ",".join(self.fields["tweet_fields"]),
+                  "user.fields": ",".join(self.fields["user_fields"])}
+        params = {key:val for (key, val) in params.items() if val}
+        with self.session.get(f"{self.url}/2/tweets/search/stream", params=params, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            log.info("Connected to filtered stream.")
+            if on_connect is not None:
+                on_connect()
+            for line in response.iter_lines():
+                # Empty lines are keep-alive signals, yielded as empty messages (every 20 seconds when quiet).
+                if not line:
+                    yield {}
+                    continue
+                try:
+                    yield serial.loads(line)
+                except ValueError:
+                    log.warning("Skipping unreadable filtered stream message: %r", line[:200])
+
+    def messages(self, on_connect:Optional[Callable]=None, max_backoff:Optional[float]=320.0) -> Iterator[Dict]:
+        """ Yields stream messages forever, reconnecting with backoff as recommended for the filtered stream:
+            linear (from 0.25s, up to 16s) for network errors, exponential (from 5s, or 60s when rate limited)
+            for HTTP errors. `on_connect` is called once every (re)connection is established, before the first
+            message is read, e.g. to backfill tweets missed while disconnected. Tweets posted meanwhile can be
+            both backfilled and streamed: the caller deduplicates them. Keep-alive signals are yielded as empty
+            messages, so the caller can do periodic work (e.g. renew leases) through quiet periods.
+        """
+        network, http = 0.0, 0.0
+        while True:
+            try:
+                for message in self.connect(on_connect):
+                    network, http = 0.0, 0.0
+                    yield message
+                log.warning("Filtered stream closed by the server, reconnecting.")
+            except requests.HTTPError as e:
+                start = 60.0 if e.response is not None and e.response.status_code == 429 else 5.0
+                http = min(max_backoff, http * 2 if http else start)
+                log.warning("Filtered stream HTTP error (%s), reconnecting in %.2fs.", e, http)
+                time.sleep(http)
+            except requests.RequestException as e:
+                # Connection errors, timeouts and streams cut mid-chunk (ChunkedEncodingError).
+                network = min(16.0, network + 0.25)
+                log.warning("Filtered stream network error (%r), reconnecting in %.2fs.", e, network)
+                time.sleep(network)
+
+
+def run(args:Namespace) -> None:
+    '''
+    Streams tweets matching the search query through the pipeline, one tweet at a time.
+    '''
+    log.info("Stream Arguments: %s", args)
+
+    context = setup(args)
+    config = context["config"]
+    stream_config = config.get("stream", {})
+    # Streamed and backfilled tweets are requested with the same fields
+    search_config = shards(config["search"]["config"])[0]
+    search_config["fields"] = field_profile(stream_config.get("fields", search_config.get("fields", "full")), config.get("field-profiles"))
+
+    # A single filtered stream connection is allowed per app: only the holder of the stream lease connects.
+    leases, name = context["leases"], "stream/{}".format(stream_config.get("tag", "twiff"))
+    if leases is not None and not leases.acquire(name):
+        teardown(context)
+        return
+
+    stream = StreamClient(context["client"].bearer_token, url=stream_config.get("url", "https://api.twitter.com"), fields=search_config["fields"])
+    stream.sync_rules(search_config["query"], tag=stream_config.get("tag", "twiff"))
+
+    # Ids of the last backfill, which may also be streamed: the connection is opened before the backfill
+    backfilled = set()
+
+    def backfill() -> None:
+        # Resume by tweet id: fetch whatever was posted since the newest tweet in the cursor while disconnected.
+        backfilled.clear()
+        if stream_config.get("backfill", True):
+            tweets, users, errors, metadata, referenced = search(client=context["client"], max_requests=args.max_requests, **search_config)
+            if tweets:
+                backfilled.update(tweets)
+                process(context, args, tweets, users, referenced)
+
+    count = 0
+    try:
+        for message in stream.messages(on_connect=backfill):
+            # Keep the lease, also through quiet periods, renewing a few times per ttl rather than for every tweet.
+            if leases is not None and not leases.keep(name):
+                break
+            if not message:
+                continue
+            if "data" not in message:
+                log.warning("Filtered stream message without data: %s", message.get("errors"))
+                continue
+            tweet = message["data"]
+            if tweet["id"] in backfilled:
+                log.debug("Skipping streamed tweet ID (%s), already backfilled.", tweet["id"])
+                continue
+            users = {user["id"]:user for user in message.get("includes", {}).get("users", [])}
+            process(context, args, {tweet["id"]: tweet}, users, referenced_index(message.get("includes", {})))
+
+            # Advance the cursor so a reconnect only backfills what was missed.
+            cursor = Cursor(search_config["cursor"])
+            cursor._update(tweet["id"], tweet["id"])
+            cursor._dump(search_config["cursor"])
+
+            count += 1
+            if args.max_tweets is not None and count >= args.max_tweets:
+                break
+    finally:
+        teardown(context)
+    log.info("Processed %d streamed tweets.", count)
+
+
+def get_arg_parser() -> ArgumentParser:
+    '''
+    Argument Parser
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description='Twitter Filtered Stream',
+                                     epilog='Please contact Sam for further help.')
+    parser.add_argument('--config', type=str,
+                        help='Configuration file for running the job.')
+    parser.add_argument('--max_requests', type=int, default=None,
+                        help='Maximum number of requests.')
+    parser.add_argument('--max_tweets', type=int, default=None,
+                        help='Stop after this many streamed tweets, runs forever if not set.')
+    parser.add_argument('--profile', type=serial.loads, default=None,
+                        help='Profiling configuration {"output": dir, "stage": name}, disabled if not set.')
+    return parser
+
+
+def parse_args(args:Optional[Dict[str,Any]]={}) -> Namespace:
+    '''
+    Parse Arguments
+    '''
+    parser = get_arg_parser()
+    parser.set_defaults(**args)
+    args = parser.parse_args([])
+    return args
+
+
+def main(args:Optional[Dict[str,Any]]={}) -> None:
+    '''
+    Entry point.
+    '''
+    args = parse_args(args)
+    run(args)
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,112 @@
+import bisect
+import hashlib
+import logging
+
+from typing import *
+
+log = logging.getLogger(__name__)
+
+
+def read_keys(path:Optional[str]) -> Dict[str,str]:
+    """ Reads API keys from a KEY=VALUE file (e.g. the docker secret referenced by TWITTER_API_KEYS_FILE).
+    """
+    if path is None:
+        raise ValueError("No API_KEYS file provided in environment variables. User should implement a method here to read keys from args.")
+    keys = {}
+    with open(path, "r") as fp:
+        for line in fp.readlines():
+            key, val = line.split("=")
+            keys[key] = val.strip()
+    return keys
+
+
+def make_client(keys:Dict[str,str]) -> Any:
+    from tweepy import Client
+    return Client(
+        keys['BEARER_TOKEN'],
+        keys['API_KEY'], keys['API_KEY_SECRET'],
+        keys['ACCESS_TOKEN'], keys['ACCESS_TOKEN_SECRET'],
+        return_type=dict, wait_on_rate_limit=True
+    )
+
+
+class Account:
+    def __init__(self, name:str, client:Any, budget:Optional[Any]=None) -> None:
+        self.name = name
+        self.client = client
+        self.budget = None
+        if budget is not None:
+            self.attach(budget)
+
+    def __repr__(self):
+        return repr('Account ({})'.format(self.name))
+
+    def attach(self, budget:Optional[Any]) -> None:
+        # Each account has its own rate-limit windows, so its own ledger.
+        self.budget = budget
+        if budget is not None:
+            budget.attach(self.client)
+
+
+class AccountPool:
+    """ Pool of authenticated bot accounts sharing the interaction work.
+
+        Like, retweet and reply limits apply per authenticated user, so interactions are spread over the
+        accounts by consistent hashing on a shard key (the conversation id), which keeps all replies within a
+        conversation on the same account and only moves 1/N of the keys when an account is added or removed.
+
+        Args:
+            keys (Dict[str,str]): Account name -> path of its KEY=VALUE API keys file.
+            budget (Optional[str]=None): Budget ledger path template, formatted with the account `name`.
+            replicas (Optional[int]=64): Number of points per account on the hash ring.
+
+        Example::
+            >>> pool = AccountPool({"bot1": "/run/secrets/bot1", "bot2": "/run/secrets/bot2"})
+            >>> account = pool.select(tweet["conversation_id"])
+            >>> account.client.like(tweet["id"])
+    """
+
+    def __init__(self, keys:Dict[str,str], budget:Optional[str]=None, replicas:Optional[int]=64) -> None:
+        from twiff.utils.budget import Budget
+
+        self.accounts = {}
+        for name, path in keys.items():
+            self.accounts[name] = Account(name, make_client(read_keys(path)), Budget(budget.format(name=name)) if budget is not None else None)
+
+        self.ring = sorted((self._hash(f"{name}#{idx}"), name) for name in self.accounts for idx in range(replicas))
+        self.points = [point for (point, name) in self.ring]
+
+        log.info('Loading... %r', self)
+
+    def __repr__(self):
+        return repr('AccountPool: {}'.format(', '.join(self.accounts)))
+
+    def __iter__(self) -> Iterator[Account]:
+        return iter(self.accounts.values())
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def __getitem__(self, name:str) -> Account:
+        return self.accounts[name]
+
+    def get(self, name:Optional[str]) -> Account:
+        # Records written before sharding (no account name) belong to the first account.
+        return self.accounts.get(name, next(iter(self.accounts.values())))
+
+    @staticmethod
+    def _hash(key:str) -> int:
+        return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+    def select(self, key:str) -> Account:
+        idx = bisect.bisect(self.points, self._hash(str(key))) % len(self.points)
+        return self.accounts[self.ring[idx][1]]
+
+    def split(self, parsed_tweets:Dict, shard_keys:Optional[Dict[str,str]]=None) -> Dict[str,Dict]:
+        """ Splits parsed tweets by account, preserving their order. Tweets without a shard key use their id.
+        """
+        shard_keys = shard_keys or {}
+        shards = {name:{} for name in self.accounts}
+        for idx, (id_str, parsed_tweet) in enumerate(parsed_tweets.items()):
+            shards[self.select(shard_keys.get(id_str, id_str)).name][id_str] = parsed_tweet
+        return shards
@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import pathlib
+
+from typing import *
+
+from twiff.interact.records import to_dict
+from twiff.utils import serial
+
+log = logging.getLogger(__name__)
+
+
+class Backlog:
+    """ Persistent (SQLite) queue of parsed tweets still waiting for an interaction.
+
+        Tweets that do not fit in a run's request allowance are queued per interaction type instead of being
+        dropped (the search cursor has already moved past them), and are drained first by the next run.
+        Entries older than `max_age` seconds are expired rather than acted on.
+
+        Concurrent runs may share the queue: `pending` claims the entries it returns for this `owner` (in a single
+        transaction), so no other run returns them until `update` puts the leftovers back or the claim is older
+        than `claim_ttl` seconds (the claiming run died).
+
+        Args:
+            path (str): Path of the SQLite database.
+            max_age (Optional[int]=86400): Age in seconds after which queued tweets are discarded.
+            owner (Optional[str]=None): Claim holder name, defaults to host:pid:random.
+            claim_ttl (Optional[int]=900): Seconds after which a claim is considered abandoned.
+
+        Example::
+            >>> backlog = Backlog("/path/to/backlog.db")
+            >>> backlog.update("like", done=[], queued={"1530482360491331587": parsed_tweet})
+            >>> backlog.pending("like")
+            {'1530482360491331587': {...}}
+    """
+
+    def __init__(self, path:str, max_age:Optional[int]=86400, owner:Optional[str]=None, claim_ttl:Optional[int]=900) -> None:
+        self.path = pathlib.Path(path)
+        self.max_age = max_age
+        self.owner = owner if owner is not None else '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.claim_ttl = claim_ttl
+        self.db = sqlite3.connect(str(self.path), timeout=30)
+        self.db.execute('CREATE TABLE IF NOT EXISTS backlog (action TEXT, id TEXT, parsed TEXT, created REAL, owner TEXT, claimed REAL, PRIMARY KEY (action, id))')
+        # Queues created before claims existed
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(backlog)')}
+        for column, kind in (('owner', 'TEXT'), ('claimed', 'REAL')):
+            if column not in columns:
+                self.db.execute(f'ALTER TABLE backlog ADD COLUMN {column} {kind}')
+        self.db.commit()
+
+        log.info('Loading... %r', self)
+
+    def __repr__(self):
+        return repr('Backlog ({}): max_age={}'.format(self.path, self.max_age))
+
+    def counts(self) -> Dict[str,int]:
+        return dict(self.db.execute('SELECT action, COUNT(*) FROM backlog GROUP BY action').fetchall())
+
+    def expire(self) -> int:
+        if self.max_age is None:
+            return 0
+        with self.db:
+            expired = self.db.execute('DELETE FROM backlog WHERE created < ?', (time.time() - self.max_age,)).rowcount
+        if expired:
+            log.info('Expired %d queued interactions older than %ds.', expired, self.max_age)
+        return expired
+
+    def pending(self, action:str) -> Dict[str,Dict]:
+        """ Claims and returns the queued tweets of an action that are not claimed by another run.
+        """
+        self.expire()
+        now = time.time()
+        # Single transaction: the claiming UPDATE takes the write lock, so concurrent runs claim disjoint entries.
+        with self.db:
+            self.db.execute('UPDATE backlog SET owner = ?, claimed = ? WHERE action = ? AND (owner IS NULL OR owner = ? OR claimed < ?)',
+                            (self.owner, now, action, self.owner, now - self.claim_ttl))
+            rows = self.db.execute('SELECT id, parsed FROM backlog WHERE action = ? AND owner = ? ORDER BY created', (action, self.owner)).fetchall()
+        return {id_str:serial.loads(parsed) for (id_str, parsed) in rows}
+
+    def update(self, action:str, done:Iterable[str], queued:Dict[str,Dict]) -> None:
+        # Single transaction: tweets handed to the dispatcher leave the queue as the leftovers enter it (or, if
+        # claimed by this run, are released).
+        now = time.time()
+        with self.db:
+            self.db.executemany('DELETE FROM backlog WHERE action = ? AND id = ?', [(action, id_str) for id_str in done])
+            self.db.executemany('INSERT INTO backlog (action, id, parsed, created) VALUES (?, ?, ?, ?) '
+                                'ON CONFLICT (action, id) DO UPDATE SET owner = NULL, claimed = NULL WHERE backlog.owner = ?',
+                                [(action, id_str, serial.dumps(to_dict(parsed)), now, self.owner) for (id_str, parsed) in queued.items()])
+        if queued:
+            log.info('Queued %d tweets for a later %s.', len(queued), action)
+
+    def close(self) -> None:
+        log.info('Closing... %r (%s)', self, ', '.join('{}={}'.format(action, count) for (action, count) in self.counts().items()))
+        # Release the claims of a run that stopped between `pending` and `update`.
+        with self.db:
+            self.db.execute('UPDATE backlog SET owner = NULL, claimed = NULL WHERE owner = ?', (self.owner,))
+        self.db.close()
@@ -0,0 +1,174 @@
+import re
+import time
+import logging
+import pathlib
+
+from typing import *
+from urllib.parse import urlparse
+
+from twiff.utils import serial
+from twiff.utils.leases import file_lock
+
+log = logging.getLogger(__name__)
+
+# Endpoints tracked by the ledger: name -> (method, path pattern, default requests per window).
+ENDPOINTS = {
+    'search': ('GET', re.compile(r'^/2/tweets/search/recent$'), 450),
+    'like': ('POST', re.compile(r'^/2/users/\d+/likes$'), 50),
+    'retweet': ('POST', re.compile(r'^/2/users/\d+/retweets$'), 50),
+    'reply': ('POST', re.compile(r'^/2/tweets$'), 200),
+}
+
+
+class Budget:
+    """ Persistent rate-limit ledger, one entry per endpoint and 15-minute window.
+
+        The ledger is kept current from the `x-rate-limit-*` headers of every API response (via a requests
+        response hook on the tweepy client session) and persisted between runs, so a run knows how much of
+        the current window earlier runs already spent.
+
+        Concurrent runs may share the ledger: `sync` merges it with the file under an exclusive file lock, adding
+        up what every run spent in the current window rather than keeping the last writer's view.
+
+        Args:
+            path (str): Path of the ledger file (JSON).
+            limits (Optional[Dict[str,int]]=None): Override of the default requests per window by endpoint.
+            window (Optional[int]=900): Window length in seconds, used until the API reports a reset time.
+
+        Example::
+            >>> budget = Budget("/path/to/budget.json")
+            >>> budget.attach(client)
+            >>> budget.remaining("like")
+            50
+    """
+
+    def __init__(self, path:str, limits:Optional[Dict[str,int]]=None, window:Optional[int]=900) -> None:
+        self.path = pathlib.Path(path)
+        self.limits = {name:limit for (name, (method, pattern, limit)) in ENDPOINTS.items()}
+        self.limits.update(limits or {})
+        self.window = window
+        self.data = self._load(self.path)
+        # Requests spent since the last sync that the file does not know about yet
+        self.spent = {}
+
+        log.info('Loading... %r', self)
+
+    def __repr__(self):
+        return repr('Budget ({}): {}'.format(self.path, ', '.join('{}={}'.format(name, self.remaining(name)) for name in self.limits)))
+
+    def _load(self, path:pathlib.Path) -> Dict[str,Dict]:
+        if path.exists():
+            return serial.load(path)
+        return {}
+
+    def _dump(self) -> None:
+        serial.dump(self.data, self.path, atomic=True)
+
+    def _merge(self, data:Dict[str,Dict]) -> None:
+        now = time.time()
+        for name, theirs in data.items():
+            ours = self.data.get(name)
+            if theirs['reset'] <= now:
+                continue
+            if ours is None or ours['reset'] <= now:
+                self.data[name] = theirs
+                continue
+            # Same window: the file holds what other runs spent, ours what this run saw (headers) or spent.
+            ours['remaining'] = max(0, min(ours['remaining'], theirs['remaining'] - self.spent.get(name, 0)))
+            ours['reset'] = max(ours['reset'], theirs['reset'])
+
+    def sync(self) -> None:
+        """ Read-merge-write of the ledger file, under the file lock.
+        """
+        with file_lock(self.path):
+            self._merge(self._load(self.path))
+            self._dump()
+        self.spent = {}
+
+    def _hook(self, response:Any, *args, **kwargs) -> None:
+        path = urlparse(response.url).path
+        for name, (method, pattern, limit) in ENDPOINTS.items():
+            if response.request.method == method and pattern.match(path):
+                self._update(name, response.headers)
+                break
+
+    def _update(self, name:str, headers:Mapping[str,str]) -> None:
+        if 'x-rate-limit-remaining' in headers:
+            self.data[name] = {'limit': int(headers.get('x-rate-limit-limit', self.limits[name])),
+                               'remaining': int(headers['x-rate-limit-remaining']),
+                               'reset': int(headers.get('x-rate-limit-reset', time.time() + self.window))}
+            # The API counts the requests of every run
+            self.spent.pop(name, None)
+        else:
+            self.spend(name)
+
+    def attach(self, client:Any) -> None:
+        client.session.hooks['response'].append(self._hook)
+
+    def spend(self, name:str, requests:Optional[int]=1) -> None:
+        entry = self.data.get(name)
+        if entry is None or entry['reset'] <= time.time():
+            entry = {'limit': self.limits[name], 'remaining': self.limits[name], 'reset': int(time.time() + self.window)}
+        entry['remaining'] = max(0, entry['remaining'] - requests)
+        self.data[name] = entry
+        self.spent[name] = self.spent.get(name, 0) + requests
+
+    def remaining(self, name:str) -> int:
+        entry = self.data.get(name)
+        if entry is None or entry['reset'] <= time.time():
+            return self.limits[name]
+        return entry['remaining']
+
+    def allowance(self, name:str, max_requests:Optional[int]) -> int:
+        # max_requests=None disables the interaction, as before the ledger existed.
+        if not max_requests:
+            return 0
+        # Pick up what concurrent runs spent since the last sync
+        self.sync()
+        return min(max_requests, self.remaining(name))
+
+    def close(self) -> None:
+        self.sync()
+        log.info('Dumping... %r', self)
+
+
+class BudgetShare:
+    """ View of a budget ledger that grants only a fair share of it: allowances are capped at 1/`parts` of the
+        remaining requests (rounded up). Everything else is delegated to the ledger, so spending is still
+        accounted on it.
+
+        Args:
+            budget (Budget): The shared ledger.
+            parts (int): Number of consumers still to be served from the remaining requests, including this one.
+
+        Example::
+            >>> like(client, parsed_tweets, condition, max_requests=50, budget=BudgetShare(budget, parts=3))
+    """
+
+    def __init__(self, budget:Budget, parts:int) -> None:
+        self.budget = budget
+        self.parts = parts
+
+    def __repr__(self):
+        return repr('BudgetShare (1/{}): {!r}'.format(self.parts, self.budget))
+
+    def __getattr__(self, name:str) -> Any:
+        return getattr(self.budget, name)
+
+    def allowance(self, name:str, max_requests:Optional[int]) -> int:
+        return min(self.budget.allowance(name, max_requests), -(-self.budget.remaining(name) // self.parts))
+
+
+def prioritise(parsed_tweets:Dict) -> Dict:
+    """ Orders parsed tweets so that the remaining budget is spent on the most valuable actions first:
+        successful parses before failed ones, then fresh (larger snowflake id) before old tweets.
+
+        Args:
+            parsed_tweets (Dict): Parsed tweets, Key=tweet_id.
+
+        Returns:
+            parsed_tweets (Dict): The same parsed tweets in priority order.
+
+    """
+    order = sorted(parsed_tweets.items(), key=lambda item: (item[1]["response"] != "success", -int(item[0])))
+    return dict(order)
@@ -0,0 +1,142 @@
+import random
+import logging
+import datetime
+
+from typing import *
+
+from twiff.utils.io import TWITTER_EPOCH
+
+log = logging.getLogger(__name__)
+
+HASHTAGS = ["#twiff", "#Twiff", "#TWIFF", "#twiff", "#twiff"]
+DELIMITERS = [",", ";", "|", "/", "-", ":", "*"]
+BRACKETS = [("(", ")"), ("[", "]"), ("{", "}"), ("#", "")]
+ORGANISATIONS = ["FFF", "Fridays For Future", "XR", "Extinction Rebellion", "Greenpeace", "Climate Strike", "ClimateActionNow", "S4F", "Parents4Future", "FFF Uganda"]
+COUNTRIES = ["Germany", "Uganda", "USA", "Nederland", "India", "Sweden", "Brazil", "Kenya", "UK", "Philippines", "De"]
+STATES = ["Bavaria", "NY", "California", "Kerala", "Noord-Holland", "Ontario"]
+CITIES = ["Berlin", "Kampala", "New York", "Amsterdam", "Mumbai", "Stockholm", "Sao Paulo", "Nairobi", "London", "Manila", "St. Gallen"]
+WORDS = ["Today", "we", "were", "striking", "for", "the", "climate", "again", "join", "us", "next", "Friday", "!", "🌍", "#ClimateStrike", "@GretaThunberg"]
+DATE_FORMATS = ["%d-%m-%Y", "%Y-%m-%d", "%m/%d/%Y", "%Y/%d/%m"]
+
+
+def snowflake(timestamp:datetime.datetime, rng:random.Random) -> str:
+    return str(((int(timestamp.timestamp() * 1000) - TWITTER_EPOCH) << 22) | rng.getrandbits(22))
+
+
+class TwiffCorpus:
+    """ Seeded generator of realistic (synthetic) twiff tweets for differential parser testing.
+
+        Covers the variations the parser has to deal with: hashtag spelling, delimiters, brackets, field
+        order, dates in all four formats accepted by `TryParseDateOnly_v2`, quoted tweets with
+        `referenced_tweets` and their expanded URL, pic.twitter.com display URLs, trailing text and links,
+        banned words and ignored users. The same seed always produces the same corpus.
+
+        Args:
+            seed (Optional[int]=0): Random seed.
+            banned_words (Optional[Dict]=None): "single_words" and "multi_words" lists, as in parser.json.
+            ignored_users (Optional[List[str]]=None): Usernames of ignored users.
+            num_users (Optional[int]=1000): Size of the author population.
+
+        Example::
+            >>> corpus = TwiffCorpus(seed=42)
+            >>> for tweet, users in corpus.generate(1000000):
+            >>>     parser(tweet, users)
+    """
+
+    def __init__(self, seed:Optional[int]=0, banned_words:Optional[Dict]=None, ignored_users:Optional[List[str]]=None, num_users:Optional[int]=1000) -> None:
+        self.rng = random.Random(seed)
+        self.banned_words = banned_words or {"single_words": [], "multi_words": []}
+        self.users = [self._user(f"user{idx}") for idx in range(num_users)]
+        self.users += [self._user(username) for username in (ignored_users or [])]
+        self.start = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def _user(self, username:str) -> Dict:
+        return {"id": str(self.rng.getrandbits(60)), "name": username.title(), "username": username}
+
+    def _date(self) -> str:
+        rng = self.rng
+        if rng.random() < 0.05:
+            # Near misses: wrong length or unparseable
+            return rng.choice(["2022-1-5", "31.12.22", "12/31/22", "2022/12/311"])
+        date = self.start + datetime.timedelta(days=rng.randrange(730))
+        return date.strftime(rng.choice(DATE_FORMATS))
+
+    def _fields(self) -> List[str]:
+        rng = self.rng
+        fields = [str(rng.choice([1, 2, 3, 5, 10, 12, 25, 50, 100, 250, 1000]))]
+        fields.append(rng.choice(ORGANISATIONS))
+        fields.append(rng.choice(COUNTRIES))
+        if rng.random() < 0.3:
+            fields.append(rng.choice(STATES))
+        fields.append(rng.choice(CITIES))
+        if rng.random() < 0.5:
+            fields.append(self._date())
+        if rng.random() < 0.1:
+            fields.append(f"https://example.org/{rng.getrandbits(16)}")
+        # Humans: missing, swapped, empty or extra fields
+        if rng.random() < 0.15:
+            del fields[rng.randrange(len(fields))]
+        if rng.random() < 0.15:
+            i, j = rng.randrange(len(fields)), rng.randrange(len(fields))
+            fields[i], fields[j] = fields[j], fields[i]
+        if rng.random() < 0.05:
+            fields.insert(rng.randrange(len(fields) + 1), "")
+        return fields
+
+    def tweet(self) -> Tuple[Dict, Dict]:
+        rng = self.rng
+        author = rng.choice(self.users)
+        created_at = self.start + datetime.timedelta(seconds=rng.randrange(730 * 86400))
+        tweet_id = snowflake(created_at, rng)
+        tweet = {"id": tweet_id,
+                 "author_id": author["id"],
+                 "conversation_id": tweet_id,
+                 "created_at": created_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                 "entities": {},
+                 "text": ""}
+        users = {author["id"]: author}
+
+        left, right = rng.choice(BRACKETS) if rng.random() < 0.15 else ("", "")
+        delimiter = rng.choice(DELIMITERS)
+        spacing = rng.choice(["", " "])
+        body = f"{spacing}{delimiter}{spacing}".join(f"{left}{field}{right}" for field in self._fields())
+        text = rng.choice(HASHTAGS) + rng.choice([" ", "", "  "]) + body
+        if rng.random() < 0.05:
+            text = rng.choice(["#climate", "twiff", ""]) + " " + body
+        if rng.random() < 0.3:
+            text = " ".join(rng.choices(WORDS, k=rng.randint(1, 8))) + "\n" + text
+        if rng.random() < 0.2:
+            text += "\n" + " ".join(rng.choices(WORDS, k=rng.randint(1, 8)))
+        if rng.random() < 0.03:
+            text = text[:rng.randrange(12)]
+
+        urls = []
+        if rng.random() < 0.25:
+            quoted = rng.choice(self.users)
+            quote_id = snowflake(created_at - datetime.timedelta(hours=rng.randrange(1, 48)), rng)
+            tco = f"https://t.co/{rng.getrandbits(40):010x}"
+            tweet["referenced_tweets"] = [{"type": "quoted", "id": quote_id}]
+            urls.append({"url": tco, "expanded_url": f"https://twitter.com/{quoted['username']}/status/{quote_id}",
+                         "display_url": f"twitter.com/{quoted['username']}/s…"})
+            text += " " + tco
+            if rng.random() < 0.9:
+                users[quoted["id"]] = quoted
+        if rng.random() < 0.15:
+            tco = f"https://t.co/{rng.getrandbits(40):010x}"
+            urls.append({"url": tco, "expanded_url": f"https://twitter.com/{author['username']}/status/{tweet['id']}/photo/1",
+                         "display_url": f"pic.twitter.com/{rng.getrandbits(40):010x}"})
+            text += " " + tco
+        if urls:
+            tweet["entities"]["urls"] = urls
+
+        if rng.random() < 0.02 and self.banned_words["single_words"]:
+            text += " " + rng.choice(self.banned_words["single_words"])
+        if rng.random() < 0.02 and self.banned_words["multi_words"]:
+            text += " " + rng.choice(self.banned_words["multi_words"])
+
+        tweet["text"] = text
+        return tweet, users
+
+    def generate(self, count:int) -> Iterator[Tuple[Dict, Dict]]:
+        for idx in range(count):
+            yield self.tweet()
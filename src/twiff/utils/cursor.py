@@ -1,7 +1,6 @@
 import os
 import math
 import time
-import json
 import logging
 import pathlib
 import datetime
@@ -9,6 +8,8 @@ import datetime
 from typing import *
 from abc import abstractmethod, ABC
 
+from twiff.utils import serial
+
 log = logging.getLogger(__name__)
                    
 class Cursor:
@@ -17,7 +18,7 @@ class Cursor:
         self.fresh_data = {'oldest_id':None, 'newest_id':None}
         self.data = self._load(self.path) 
         
-        log.info('Loading... {}'.format(self.__repr__()))
+        log.info('Loading... %r', self)
 
     def __repr__(self):
         return repr('Cursor ({}): oldest_id={}, newest_id={}'.format(self.path, self.data['oldest_id'], self.data['newest_id']))
@@ -25,19 +26,19 @@ class Cursor:
     def _load(self, path:str) -> Dict[str,int]:
         if path is not None:
             if path.exists():
-                log.debug('Loading cursor from "{}"'.format(path))
-                with open(path, 'r') as f: 
-                    return json.load(f)
+                log.debug('Loading cursor from "%s"', path)
+                return serial.load(path)
             else:
-                log.debug('Provided cursor path "{}" does not exists... Defaulting to fresh cursor.'.format(path))
+                log.debug('Provided cursor path "%s" does not exists... Defaulting to fresh cursor.', path)
                 return self.fresh_data
         else:
-            log.debug('Loading fresh_cursor...'.format(path))
+            log.debug('Loading fresh_cursor...')
             return self.fresh_data            
     
     def _dump(self, path:str) -> None:
-        log.info('Dumping cursor to "{}"'.format(path))
-        with open(path, 'w') as f: json.dump(self.data, f)
+        log.info('Dumping cursor to "%s"', path)
+        # Atomic commit: readers see either the previous or the new cursor, never a partial write.
+        serial.dump(self.data, path, atomic=True)
     
     def _update(self, oldest_id:int, newest_id:int) -> None:
         # Update self.oldest_id if oldest_id is SMALLER (less recent than) currently stored
@@ -51,7 +52,7 @@ class Cursor:
             self.data['newest_id'] = newest_id
         else:
             self.data['newest_id'] = newest_id if newest_id>self.data['newest_id'] else self.data['newest_id'] 
-        log.info('Updated cursor: {}'.format(self.__repr__()))
+        log.info('Updated cursor: %r', self)
 
     def _oldest_id(self) -> int:
         return self.data['oldest_id']
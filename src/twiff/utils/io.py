@@ -1,9 +1,12 @@
-import json
+import shutil
 import logging
+import datetime
 from pathlib import Path
 
 from typing import *
 
+from twiff.utils import serial
+from twiff.utils.leases import file_lock
 log = logging.getLogger(__name__)
 
 
@@ -21,7 +24,132 @@ def dump_json_items(output:str, data:Dict, subdir:Optional[str]=None) -> None:
         
     # Dump item data to json
     for idx, (id_str, item) in enumerate(data.items()):
-        with open(output.joinpath(f"{id_str}.json"), 'w') as fp:
-            json.dump(item, fp)
+        with open(output.joinpath(f"{id_str}.json"), 'wb') as fp:
+            fp.write(serial.dumpb(item))
             
-    log.info(f"Dumped {len(data)} items to {output}.")
\ No newline at end of file
+    log.info("Dumped %d items to %s.", len(data), output)
+
+# Tweet ids are snowflakes: milliseconds since the Twitter epoch in the bits above the lowest 22.
+TWITTER_EPOCH = 1288834974657
+PARTITIONS = {"day": "%Y/%m/%d", "hour": "%Y/%m/%d/%H"}
+INDEX = "index.json"
+
+
+def snowflake_time(id_str:str) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(((int(id_str) >> 22) + TWITTER_EPOCH) / 1000, tz=datetime.timezone.utc)
+
+
+def snowflake_id(timestamp:datetime.datetime) -> int:
+    # Smallest id that can have been created at (or after) the given time.
+    return max(0, int(timestamp.timestamp() * 1000) - TWITTER_EPOCH) << 22
+
+
+def _load_index(path:Path) -> Dict[str,Dict]:
+    if path.exists():
+        return serial.load(path)
+    return {}
+
+
+def _dump_index(path:Path, index:Dict[str,Dict]) -> None:
+    serial.dump(index, path, sort_keys=True, atomic=True)
+
+
+def dump_partitioned_items(output:str, data:Dict, subdir:Optional[str]=None, granularity:Optional[str]="day", flat:Optional[Tuple[str,...]]=("users",)) -> None:
+    """ Dumps items into time partitions derived from their snowflake ids (e.g. tweets/2022/05/28/<id>.json) and
+        keeps an index of the min/max id and item count of every partition, so time-range reads and retention
+        deletes only touch the partitions involved. The index is updated under a file lock, so concurrent runs
+        can export to the same output directory.
+
+        Args:
+            output (str): Output directory.
+            data (Dict): Items to dump, Key=snowflake id.
+            subdir (Optional[str]=None): Subdirectory of the output directory.
+            granularity (Optional[str]="day"): Partition size, "day" or "hour".
+            flat (Optional[Tuple[str,...]]=("users",)): Subdirectories dumped without partitions (ids not snowflakes).
+
+        Example::
+            >>> dump_partitioned_items("/path/to/output", tweets, subdir="tweets")
+            >>> load_partitioned_items("/path/to/output", subdir="tweets", start=datetime.datetime(2022, 3, 1))
+    """
+    if subdir in (flat or []):
+        return dump_json_items(output, data, subdir)
+
+    root = Path(output) if subdir is None else Path(output).joinpath(subdir)
+    root.mkdir(parents=True, exist_ok=True)
+
+    partitions = {}
+    for idx, (id_str, item) in enumerate(data.items()):
+        partitions.setdefault(snowflake_time(id_str).strftime(PARTITIONS[granularity]), {})[id_str] = item
+
+    for partition, items in partitions.items():
+        path = root.joinpath(partition)
+        path.mkdir(parents=True, exist_ok=True)
+        for id_str, item in items.items():
+            with open(path.joinpath(f"{id_str}.json"), 'wb') as fp:
+                fp.write(serial.dumpb(item))
+
+    # Read-merge-write of the index, shared with concurrent exports and retention deletes.
+    with file_lock(root.joinpath(INDEX)):
+        index = _load_index(root.joinpath(INDEX))
+        for partition, items in partitions.items():
+            ids = [int(id_str) for id_str in items]
+            entry = index.get(partition, {"min_id": min(ids), "max_id": max(ids), "count": 0})
+            entry["min_id"] = min(entry["min_id"], min(ids))
+            entry["max_id"] = max(entry["max_id"], max(ids))
+            entry["count"] = sum(1 for p in root.joinpath(partition).glob("*.json"))
+            index[partition] = entry
+        _dump_index(root.joinpath(INDEX), index)
+
+    log.info("Dumped %d items to %d partitions in %s.", len(data), len(partitions), root)
+
+
+def select_partitions(output:str, subdir:Optional[str]=None, start:Optional[datetime.datetime]=None, end:Optional[datetime.datetime]=None) -> List[Path]:
+    """ Partitions (from the index) whose id range overlaps [start, end).
+    """
+    root = Path(output) if subdir is None else Path(output).joinpath(subdir)
+    low = snowflake_id(start) if start is not None else 0
+    high = snowflake_id(end) if end is not None else None
+    return [root.joinpath(partition) for (partition, entry) in sorted(_load_index(root.joinpath(INDEX)).items())
+            if entry["max_id"] >= low and (high is None or entry["min_id"] < high)]
+
+
+def load_partitioned_items(output:str, subdir:Optional[str]=None, start:Optional[datetime.datetime]=None, end:Optional[datetime.datetime]=None) -> Dict:
+    """ Loads the items created in [start, end) (timezone-aware datetimes), opening only the partitions involved.
+    """
+    low = snowflake_id(start) if start is not None else 0
+    high = snowflake_id(end) if end is not None else None
+
+    data = {}
+    for path in select_partitions(output, subdir, start, end):
+        for p in path.glob("*.json"):
+            id_str = p.name.split('.')[0]
+            if int(id_str) >= low and (high is None or int(id_str) < high):
+                data[id_str] = serial.load(p)
+    return data
+
+
+def delete_partitions(output:str, before:datetime.datetime, subdir:Optional[str]=None) -> int:
+    """ Retention: deletes the partitions whose items were all created before the given (timezone-aware) time.
+    """
+    root = Path(output) if subdir is None else Path(output).joinpath(subdir)
+    with file_lock(root.joinpath(INDEX)):
+        index = _load_index(root.joinpath(INDEX))
+        expired = [partition for (partition, entry) in index.items() if entry["max_id"] < snowflake_id(before)]
+        for partition in expired:
+            shutil.rmtree(root.joinpath(partition), ignore_errors=True)
+            del index[partition]
+        _dump_index(root.joinpath(INDEX), index)
+    log.info("Deleted %d partitions from %s.", len(expired), root)
+    return len(expired)
+
+
+def find_item(output:str, id_str:str, subdir:Optional[str]=None) -> Optional[Path]:
+    """ Path of a dumped item in either the flat or the partitioned layout, None if it was not dumped.
+    """
+    root = Path(output) if subdir is None else Path(output).joinpath(subdir)
+    candidates = [root.joinpath(f"{id_str}.json")]
+    candidates += [root.joinpath(snowflake_time(id_str).strftime(fmt), f"{id_str}.json") for fmt in PARTITIONS.values()]
+    for path in candidates:
+        if path.exists():
+            return path
+    return None
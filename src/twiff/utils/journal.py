@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+import pathlib
+
+from typing import *
+
+from twiff.utils import serial
+from twiff.utils.leases import file_lock
+
+log = logging.getLogger(__name__)
+
+
+class Journal:
+    """ Append-only write-ahead journal of interactions (likes, retweets, replies).
+
+        Every interaction is recorded as "plan" before the API call is made and as "done" once the call
+        returned. Records are buffered and flushed with a single fsync per batch, so the journal costs one
+        disk sync per `batch_size` records rather than one per call. Interactions that were planned but never
+        completed (e.g. the process died mid-run) are returned by `pending` and replayed on the next start.
+
+        Concurrent runs may share the journal: plans record the `owner` of the run (its lease holder name, see
+        `LeaseManager.alive`) so only the plans of dead runs are replayed, and appends and compaction take an
+        exclusive file lock, so compaction never drops the records of another run.
+
+        Args:
+            path (str): Path of the journal file (JSON lines).
+            batch_size (Optional[int]=32): Number of buffered records that triggers a flush.
+            owner (Optional[str]=None): Name of the run recorded with its plans.
+
+        Example::
+            >>> journal = Journal("/path/to/journal.jsonl")
+            >>> journal.plan("like", "1530482360491331587")
+            >>> journal.flush()
+            >>> client.like("1530482360491331587")
+            >>> journal.done("like", "1530482360491331587")
+            >>> journal.close()
+    """
+
+    def __init__(self, path:str, batch_size:Optional[int]=32, owner:Optional[str]=None) -> None:
+        self.path = pathlib.Path(path)
+        self.batch_size = max(1, batch_size or 1)
+        self.owner = owner
+        self.buffer = []
+        self.stats = {'records':0, 'fsyncs':0, 'seconds':0.0}
+        with file_lock(self.path):
+            self.planned = self._load(self.path)
+            self.fp = open(self.path, 'a')
+        log.info('Loaded journal "%s" with %d pending interactions.', self.path, len(self.planned))
+
+    def __repr__(self):
+        return repr('Journal ({}): pending={}, records={}, fsyncs={}'.format(self.path, len(self.planned), self.stats['records'], self.stats['fsyncs']))
+
+    def _load(self, path:pathlib.Path) -> Dict[Tuple[str,str],Dict]:
+        planned = {}
+        if path.exists():
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = serial.loads(line)
+                    except ValueError:
+                        # A torn final line is expected after a crash, anything before it is intact.
+                        log.warning('Skipping unreadable journal record in "%s".', path)
+                        continue
+                    key = (record['action'], record['id'])
+                    if record['op'] == 'plan':
+                        planned[key] = record
+                    else:
+                        planned.pop(key, None)
+        return planned
+
+    def _append(self, record:Dict) -> None:
+        self.buffer.append(serial.dumps(record))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def plan(self, action:str, tweet_id:str, **kwargs) -> None:
+        record = {'op':'plan', 'action':action, 'id':tweet_id, 'time':time.time(), **kwargs}
+        if self.owner is not None:
+            record['owner'] = self.owner
+        self.planned[(action, tweet_id)] = record
+        self._append(record)
+
+    def done(self, action:str, tweet_id:str, **kwargs) -> None:
+        self.planned.pop((action, tweet_id), None)
+        self._append({'op':'done', 'action':action, 'id':tweet_id, 'time':time.time(), **kwargs})
+
+    def pending(self) -> List[Dict]:
+        return list(self.planned.values())
+
+    def _write(self) -> None:
+        # Caller holds the file lock. Another run may have compacted (replaced) the file since it was opened.
+        if os.fstat(self.fp.fileno()).st_ino != os.stat(self.path).st_ino:
+            self.fp.close()
+            self.fp = open(self.path, 'a')
+        if not self.buffer:
+            return
+        start = time.perf_counter()
+        self.fp.write('\n'.join(self.buffer) + '\n')
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.stats['seconds'] += time.perf_counter() - start
+        self.stats['records'] += len(self.buffer)
+        self.stats['fsyncs'] += 1
+        self.buffer = []
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        with file_lock(self.path):
+            self._write()
+
+    def compact(self) -> None:
+        # Rewrite the journal with only the pending plans, completed pairs are no longer needed. The file is
+        # re-read under the lock: it also holds the records of concurrent runs.
+        with file_lock(self.path):
+            self._write()
+            self.fp.close()
+            self.planned = self._load(self.path)
+            tmp = self.path.with_suffix(self.path.suffix + '.tmp')
+            with open(tmp, 'w') as f:
+                for record in self.planned.values():
+                    f.write(serial.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.fp = open(self.path, 'a')
+
+    def close(self) -> None:
+        self.compact()
+        self.fp.close()
+        rate = self.stats['records'] / self.stats['seconds'] if self.stats['seconds'] else 0.0
+        log.info('Journal wrote %d records with %d fsyncs in %.4fs (%.0f records/s).',
+                 self.stats['records'], self.stats['fsyncs'], self.stats['seconds'], rate)
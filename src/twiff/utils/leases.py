@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+import fcntl
+import socket
+import sqlite3
+import logging
+import pathlib
+import contextlib
+
+from typing import *
+
+log = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def file_lock(path:Union[str,pathlib.Path]) -> Iterator[None]:
+    """ Exclusive advisory lock (flock) on the sidecar file "<path>.lock", for read-modify-write cycles of a file
+        shared by concurrent runs, e.g. the journal or a budget ledger.
+
+        Example::
+            >>> with file_lock("/path/to/budget.json"):
+            >>>     ...
+    """
+    with open(f"{path}.lock", 'a') as fp:
+        fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+
+class LeaseManager:
+    """ Time-limited exclusive leases (SQLite) coordinating concurrent runs on one or more nodes.
+
+        A lease names a unit of work, e.g. the search window of a cursor. Only its holder works on it until the
+        lease is released or expires (`ttl` seconds after the last renewal), so a crashed worker cannot block
+        the others for longer than `ttl`. Acquire, renew and release are single statements, atomic across
+        processes sharing the database file.
+
+        NOTE:
+            Nodes must share the database on a filesystem with working POSIX locks (a local or docker volume);
+            SQLite locking over NFS is unreliable.
+
+        Args:
+            path (str): Path of the SQLite database.
+            ttl (Optional[int]=900): Seconds a lease stays valid without renewal.
+            owner (Optional[str]=None): Holder name, defaults to host:pid:random.
+
+        Example::
+            >>> leases = LeaseManager("/path/to/leases.db")
+            >>> for name in ["/path/to/cursor-a.json", "/path/to/cursor-b.json"]:
+            >>>     if leases.acquire(name):
+            >>>         ...
+            >>>         leases.renew(name)
+            >>>         ...
+            >>>         leases.release(name)
+    """
+
+    def __init__(self, path:str, ttl:Optional[int]=900, owner:Optional[str]=None) -> None:
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+        self.owner = owner if owner is not None else '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.held = {}
+        # Autocommit: every statement is its own (atomic) transaction.
+        self.db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self.db.execute('CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires REAL)')
+
+        log.info('Loading... %r', self)
+
+    def __repr__(self):
+        return repr('LeaseManager ({}): owner={}, held={}'.format(self.path, self.owner, len(self.held)))
+
+    def acquire(self, name:str) -> bool:
+        """ Takes the lease if it is free, expired or already ours.
+        """
+        now = time.time()
+        changed = self.db.execute('INSERT INTO leases (name, owner, expires) VALUES (?, ?, ?) '
+                                  'ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires = excluded.expires '
+                                  'WHERE leases.expires < ? OR leases.owner = excluded.owner',
+                                  (name, self.owner, now + self.ttl, now)).rowcount
+        if changed:
+            self.held[name] = now
+            log.info('Acquired lease "%s" as %s.', name, self.owner)
+            return True
+        owner, = self.db.execute('SELECT owner FROM leases WHERE name = ?', (name,)).fetchone() or ('?',)
+        log.info('Lease "%s" is held by %s.', name, owner)
+        return False
+
+    def renew(self, name:str) -> bool:
+        """ Extends a held lease. Returns False if it expired and was taken over, in which case the caller must
+            stop working on it.
+        """
+        now = time.time()
+        renewed = self.db.execute('UPDATE leases SET expires = ? WHERE name = ? AND owner = ?', (now + self.ttl, name, self.owner)).rowcount
+        if renewed:
+            self.held[name] = now
+        else:
+            self.held.pop(name, None)
+            log.warning('Lost lease "%s".', name)
+        return bool(renewed)
+
+    def keep(self, name:str) -> bool:
+        """ Renews a held lease once a third of its ttl has passed, cheap enough to call for every unit of work.
+        """
+        if time.time() - self.held.get(name, 0) > self.ttl / 3:
+            return self.renew(name)
+        return name in self.held
+
+    def alive(self, owner:str) -> bool:
+        """ Whether `owner` holds an unexpired lease, i.e. is a live run.
+        """
+        return self.db.execute('SELECT 1 FROM leases WHERE owner = ? AND expires >= ?', (owner, time.time())).fetchone() is not None
+
+    def release(self, name:str) -> None:
+        self.db.execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, self.owner))
+        self.held.pop(name, None)
+        log.info('Released lease "%s".', name)
+
+    def close(self) -> None:
+        for name in list(self.held):
+            self.release(name)
+        self.db.close()
@@ -0,0 +1,88 @@
+import sys
+import queue
+import atexit
+import logging
+import datetime
+import logging.handlers
+
+from typing import *
+
+from twiff.utils import serial
+
+FORMAT = "Twitter4Future: [ %(asctime)s ] %(name)s | %(levelname)s | %(message)s"
+DATEFMT = "%m/%d/%Y %I:%M:%S%p"
+
+
+class JsonFormatter(logging.Formatter):
+    """ Formats log records as one JSON object per line.
+    """
+
+    def format(self, record:logging.LogRecord) -> str:
+        data = {"time": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(),
+                "name": record.name,
+                "level": record.levelname,
+                "message": record.getMessage(),
+                "process": record.process,
+                "thread": record.threadName}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return serial.dumps(data)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """ Queue handler that renders the message (merging its arguments) and any traceback on the calling thread,
+        so later mutation of the arguments cannot change the message, and leaves the formatting of the line
+        (timestamp, text or JSON) and all I/O to the listener thread.
+
+        NOTE:
+            The `__repr__` of every argument (e.g. `log.info('Loading... %r', self)`) still runs on the calling
+            thread, so reprs of logged objects must stay cheap: no queries, file system scans or network calls.
+    """
+
+    def prepare(self, record:logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(path:Optional[str]=None, level:Optional[str]="INFO", max_bytes:Optional[int]=10485760, backup_count:Optional[int]=5) -> logging.handlers.QueueListener:
+    """ Configures non-blocking logging: records are put on an in-memory queue and written by a background
+        listener thread to the console (text) and, if `path` is given, to a size-rotated JSON lines file.
+
+        Args:
+            path (Optional[str]=None): Log file path, only console logging if None.
+            level (Optional[str]="INFO"): Root log level.
+            max_bytes (Optional[int]=10485760): Size at which the log file is rotated.
+            backup_count (Optional[int]=5): Number of rotated log files kept.
+
+        Returns:
+            listener (QueueListener): Started listener, stopped automatically at exit.
+
+        Example::
+            >>> setup_logging("/path/to/out.log", "DEBUG")
+    """
+    handlers = []
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter(FORMAT, datefmt=DATEFMT))
+    handlers.append(stream)
+
+    if path is not None:
+        rotating = logging.handlers.RotatingFileHandler(path, mode='a', maxBytes=max_bytes, backupCount=backup_count)
+        rotating.setFormatter(JsonFormatter())
+        handlers.append(rotating)
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(records)]
+    root.setLevel(level)
+    return listener
@@ -0,0 +1,69 @@
+import time
+import pstats
+import logging
+import cProfile
+import pathlib
+import datetime
+import contextlib
+import tracemalloc
+
+from typing import *
+
+log = logging.getLogger(__name__)
+
+# Shared no-op context used when profiling is off.
+NULL = contextlib.nullcontext()
+
+
+def stage(name:str, profile:Optional[Dict]=None) -> ContextManager:
+    """ Context manager profiling a pipeline stage with cProfile and tracemalloc.
+
+        Does nothing (a shared null context) unless profiling is configured, and, when `profile["stage"]` is
+        set, only profiles the stage with that name.
+
+        Args:
+            name (str): Stage name, used in the report file names.
+            profile (Optional[Dict]=None): Profiling configuration from the args JSON.
+                output (str): Directory for the reports.
+                stage (Optional[str]): Only profile this stage.
+                top (Optional[int]=25): Number of allocation sites reported.
+
+        Example::
+            >>> with stage("parse", args.profile):
+            >>>     parsed_tweets = parse(tweets, users, parser)
+    """
+    if not profile or profile.get("stage") not in (None, name):
+        return NULL
+    return _profiled(name, pathlib.Path(profile["output"]), profile.get("top", 25))
+
+
+@contextlib.contextmanager
+def _profiled(name:str, output:pathlib.Path, top:int) -> Iterator[None]:
+    output.mkdir(parents=True, exist_ok=True)
+    prefix = output.joinpath(f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{name}")
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if not tracing:
+            tracemalloc.stop()
+
+        profiler.dump_stats(f"{prefix}.prof")
+        with open(f"{prefix}.txt", 'w') as fp:
+            fp.write(f"Stage {name}: {elapsed:.3f}s, peak traced memory {peak / 1024:.1f} KiB\n\n")
+            pstats.Stats(profiler, stream=fp).sort_stats("cumulative").print_stats(top)
+            fp.write(f"Top {top} allocation sites (difference over the stage):\n")
+            for stat in after.compare_to(before, 'lineno')[:top]:
+                fp.write(f"{stat}\n")
+        log.info("Profiled stage %s in %.3fs (peak %.1f KiB), reports in %s.*", name, elapsed, peak / 1024, prefix)
@@ -0,0 +1,144 @@
+"""
+Single JSON serialization interface for cursors, configurations, exports, journals and logs.
+
+The backend is the fastest one installed (orjson, then ujson, then the stdlib `json`), or the one named by the
+TWIFF_JSON environment variable. All backends read `str` or `bytes` and can write straight to `bytes`, so files
+are read and written in binary mode without intermediate `str` copies.
+
+"""
+import os
+import json
+import stat
+import logging
+import pathlib
+import tempfile
+
+from typing import *
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ("orjson", "ujson", "json")
+
+
+def _orjson() -> Tuple[Callable, Callable]:
+    import orjson
+
+    def dumpb(obj:Any, sort_keys:Optional[bool]=False, indent:Optional[int]=None, default:Optional[Callable]=None) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            # orjson only supports an indent of two spaces.
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+
+    return orjson.loads, dumpb
+
+
+def _ujson() -> Tuple[Callable, Callable]:
+    import ujson
+
+    def dumpb(obj:Any, sort_keys:Optional[bool]=False, indent:Optional[int]=None, default:Optional[Callable]=None) -> bytes:
+        kwargs = {"default": default} if default is not None else {}
+        return ujson.dumps(obj, sort_keys=sort_keys, indent=indent or 0, ensure_ascii=False, escape_forward_slashes=False, **kwargs).encode()
+
+    return ujson.loads, dumpb
+
+
+def _json() -> Tuple[Callable, Callable]:
+
+    def dumpb(obj:Any, sort_keys:Optional[bool]=False, indent:Optional[int]=None, default:Optional[Callable]=None) -> bytes:
+        return json.dumps(obj, sort_keys=sort_keys, indent=indent, default=default, ensure_ascii=False).encode()
+
+    return json.loads, dumpb
+
+
+_FACTORIES = {"orjson": _orjson, "ujson": _ujson, "json": _json}
+BACKEND, _loads, _dumpb = None, None, None
+
+
+def set_backend(name:Optional[str]=None) -> str:
+    """ Selects the serialization backend, the first installed of `BACKENDS` if no name is given.
+
+        Args:
+            name (Optional[str]=None): "orjson", "ujson" or "json".
+
+        Returns:
+            name (str): The backend in use, "json" if the requested one is not installed.
+
+    """
+    global BACKEND, _loads, _dumpb
+    # A requested backend falls back to the stdlib, not to whichever other backend happens to be installed.
+    for candidate in ([name, "json"] if name else list(BACKENDS)):
+        if candidate not in _FACTORIES:
+            raise ValueError(f"Unknown JSON backend: {candidate}")
+        try:
+            _loads, _dumpb = _FACTORIES[candidate]()
+        except ImportError:
+            if candidate == name:
+                log.warning("JSON backend %s is not installed, falling back to json.", name)
+            continue
+        BACKEND = candidate
+        break
+    log.debug("Using JSON backend %s.", BACKEND)
+    return BACKEND
+
+
+def loads(data:Union[str,bytes]) -> Any:
+    return _loads(data)
+
+
+def dumpb(obj:Any, sort_keys:Optional[bool]=False, indent:Optional[int]=None, default:Optional[Callable]=None) -> bytes:
+    """ Serializes to UTF-8 encoded bytes, e.g. for writing to a binary file or buffer.
+    """
+    return _dumpb(obj, sort_keys=sort_keys, indent=indent, default=default)
+
+
+def dumps(obj:Any, sort_keys:Optional[bool]=False, indent:Optional[int]=None, default:Optional[Callable]=None) -> str:
+    return _dumpb(obj, sort_keys=sort_keys, indent=indent, default=default).decode()
+
+
+def load(path:Union[str,pathlib.Path]) -> Any:
+    """ Reads a JSON file with a single binary read.
+    """
+    with open(path, 'rb') as fp:
+        return _loads(fp.read())
+
+
+def dump(obj:Any, path:Union[str,pathlib.Path], sort_keys:Optional[bool]=False, indent:Optional[int]=None, default:Optional[Callable]=None,
+         atomic:Optional[bool]=False) -> None:
+    """ Writes a JSON file with a single binary write.
+
+        With `atomic`, the data is written (and fsynced) to a uniquely named temporary file in the target directory
+        and renamed over `path`, so readers see either the previous or the new file, never a partial write, and
+        concurrent writers never share a temporary file.
+
+        Example::
+            >>> from twiff.utils import serial
+            >>> serial.dump({"oldest_id": None, "newest_id": None}, "/path/to/cursor.json", atomic=True)
+            >>> serial.load("/path/to/cursor.json")
+            {'oldest_id': None, 'newest_id': None}
+    """
+    data = _dumpb(obj, sort_keys=sort_keys, indent=indent, default=default)
+    if not atomic:
+        with open(path, 'wb') as fp:
+            fp.write(data)
+        return
+
+    path = pathlib.Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        # mkstemp creates the file private (0600), keep the permissions of the file it replaces.
+        os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode) if path.exists() else 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+set_backend(os.environ.get("TWIFF_JSON"))
@@ -0,0 +1,136 @@
+import time
+import hashlib
+import logging
+import pathlib
+
+from typing import *
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from twiff.utils import serial
+from twiff.interact.records import to_dict
+
+log = logging.getLogger(__name__)
+
+
+class Uploader:
+    """ Batched upload of successfully parsed actions to the map backend.
+
+        Actions are POSTed as {"actions": [...]} in batches of `batch_size` over a single keep-alive session.
+        Every action carries an idempotency key derived from its tweet id, and every batch an `Idempotency-Key`
+        header derived from its tweet ids, so retried or replayed batches are safe to accept twice. Transient
+        failures (connection errors, 429 and 5xx) are retried with backoff. Batches that still fail are spooled
+        to disk and sent first by the next upload, batches rejected by the backend (other 4xx) are kept in the
+        spool's "rejected" directory for inspection.
+
+        Args:
+            url (str): Endpoint accepting the batches.
+            spool (str): Spool directory.
+            batch_size (Optional[int]=100): Actions per request.
+            headers (Optional[Dict[str,str]]=None): Extra request headers, e.g. authorization.
+            retries (Optional[int]=3): Retries per request.
+            timeout (Optional[float]=10.0): Request timeout in seconds.
+
+        Example::
+            >>> uploader = Uploader("http://localhost:8000/api/actions", spool="/path/to/spool")
+            >>> uploader.upload(parsed_tweets)
+            >>> uploader.close()
+    """
+
+    def __init__(self, url:str, spool:str, batch_size:Optional[int]=100, headers:Optional[Dict[str,str]]=None,
+                 retries:Optional[int]=3, timeout:Optional[float]=10.0) -> None:
+        self.url = url
+        self.spool = pathlib.Path(spool)
+        self.spool.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.stats = {'sent': 0, 'spooled': 0, 'rejected': 0}
+
+        # POST is retried too: the idempotency keys make it safe.
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None, raise_on_status=False)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(max_retries=retry))
+        self.session.mount('https://', HTTPAdapter(max_retries=retry))
+        self.session.headers.update({'Content-Type': 'application/json', **(headers or {})})
+
+        log.info('Loading... %r', self)
+
+    def __repr__(self):
+        return repr('Uploader ({}): spool={}, batch_size={}'.format(self.url, self.spool, self.batch_size))
+
+    @staticmethod
+    def action(id_str:str, parsed_tweet:Dict) -> Dict:
+        parsed_tweet = to_dict(parsed_tweet)
+        return {'idempotency_key': f'twiff-{id_str}', 'id': id_str, 'twiff_id': parsed_tweet['twiff_id'],
+                'quote_id': parsed_tweet['quote_id'], 'tweettype': parsed_tweet['tweettype'], **parsed_tweet['data']}
+
+    def _post(self, key:str, actions:List[Dict]) -> Optional[bool]:
+        """ Sends a batch: True if accepted, False if rejected by the backend, None if it is unreachable.
+        """
+        try:
+            response = self.session.post(self.url, data=serial.dumpb({'actions': actions}), headers={'Idempotency-Key': key}, timeout=self.timeout)
+        except requests.RequestException as e:
+            log.warning('Upload of %d actions failed: %r', len(actions), e)
+            return None
+        if response.status_code == 429 or response.status_code >= 500:
+            log.warning('Upload of %d actions failed: HTTP %d.', len(actions), response.status_code)
+            return None
+        if response.status_code >= 400:
+            log.error('Upload of %d actions rejected: HTTP %d %s', len(actions), response.status_code, response.text[:200])
+            return False
+        return True
+
+    def _spool(self, key:str, actions:List[Dict], subdir:Optional[str]=None) -> None:
+        path = self.spool if subdir is None else self.spool.joinpath(subdir)
+        path.mkdir(exist_ok=True)
+        serial.dump({'key': key, 'actions': actions}, path.joinpath(f'{time.time_ns()}-{key}.json'))
+
+    def drain(self) -> bool:
+        """ Sends spooled batches, oldest first. Returns False (leaving the rest spooled) if the backend is down.
+        """
+        for path in sorted(self.spool.glob('*.json')):
+            batch = serial.load(path)
+            sent = self._post(batch['key'], batch['actions'])
+            if sent is None:
+                return False
+            if sent:
+                self.stats['sent'] += len(batch['actions'])
+                path.unlink()
+            else:
+                self.stats['rejected'] += len(batch['actions'])
+                self.spool.joinpath('rejected').mkdir(exist_ok=True)
+                path.replace(self.spool.joinpath('rejected', path.name))
+        return True
+
+    def upload(self, parsed_tweets:Dict) -> int:
+        """ Uploads the successfully parsed twiffs, returns the number of actions sent now (not spooled). Tweets
+            of ignored users parse successfully but have no twiff id, they are not uploaded.
+        """
+        actions = [self.action(id_str, parsed_tweet) for (id_str, parsed_tweet) in parsed_tweets.items()
+                   if parsed_tweet['response'] == 'success' and parsed_tweet['twiff_id'] is not None]
+        online = self.drain()
+        sent = 0
+        for idx in range(0, len(actions), self.batch_size):
+            batch = actions[idx:idx + self.batch_size]
+            key = hashlib.sha1(','.join(action['id'] for action in batch).encode()).hexdigest()
+            # Keep the order of the backlog: once the backend is down, spool the remaining batches without trying.
+            result = self._post(key, batch) if online else None
+            if result is None:
+                online = False
+                self._spool(key, batch)
+                self.stats['spooled'] += len(batch)
+            elif result:
+                sent += len(batch)
+                self.stats['sent'] += len(batch)
+            else:
+                self._spool(key, batch, 'rejected')
+                self.stats['rejected'] += len(batch)
+        log.info('Uploaded %d of %d actions.', sent, len(actions))
+        return sent
+
+    def close(self) -> None:
+        self.drain()
+        self.session.close()
+        log.info('Closing... %r (%s)', self, ', '.join('{}={}'.format(key, val) for (key, val) in self.stats.items()))
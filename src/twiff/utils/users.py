@@ -0,0 +1,122 @@
+import time
+import logging
+import pathlib
+
+from typing import *
+
+from twiff.utils import serial
+from twiff.utils.leases import file_lock
+
+log = logging.getLogger(__name__)
+
+USER_FIELDS = ['created_at', 'description', 'entities', 'id', 'location', 'name', 'url', 'username', 'verified', 'withheld']
+
+
+class UserDirectory:
+    """ Persistent directory of users seen in search responses, with TTL expiry.
+
+        Filled from the `includes.users` of every search so users referenced by later tweets (e.g. the author of
+        a quoted tweet missing from the includes) can still be resolved. Misses are looked up in batches of up
+        to 100 usernames per call to the multi-user lookup endpoint. Usernames are case-insensitive, and those the
+        endpoint does not know (e.g. suspended users) are remembered for `ttl` seconds too.
+
+        Args:
+            path (str): Path of the directory file (JSON).
+            ttl (Optional[int]=604800): Seconds after which an entry is considered stale.
+
+        Example::
+            >>> directory = UserDirectory("/path/to/users.json")
+            >>> directory.update(users)
+            >>> directory.resolve(client, ["twiff_bot"])
+            >>> directory.get_by_name("twiff_bot")
+            {'id': '...', 'name': '...', 'username': 'twiff_bot'}
+    """
+
+    def __init__(self, path:str, ttl:Optional[int]=604800) -> None:
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+        self.data, self.misses = self._load(self.path)
+        self.names = {entry['user']['username'].lower():id_str for (id_str, entry) in self.data.items()}
+
+        log.info('Loading... %r', self)
+
+    def __repr__(self):
+        return repr('UserDirectory ({}): users={}, misses={}'.format(self.path, len(self.data), len(self.misses)))
+
+    def _load(self, path:pathlib.Path) -> Tuple[Dict[str,Dict],Dict[str,float]]:
+        if path.exists():
+            data = serial.load(path)
+            # Files written before misses were remembered hold the users only.
+            users, misses = (data['users'], data['misses']) if 'users' in data else (data, {})
+            # Drop expired entries on load so the file does not grow without bound.
+            now = time.time()
+            return ({id_str:entry for (id_str, entry) in users.items() if now - entry['time'] < self.ttl},
+                    {name:seen for (name, seen) in misses.items() if now - seen < self.ttl})
+        return {}, {}
+
+    def _dump(self) -> None:
+        # Concurrent runs share the directory: merge with the file under the lock, the newest entry wins.
+        with file_lock(self.path):
+            users, misses = self._load(self.path)
+            for id_str, entry in users.items():
+                if id_str not in self.data or entry['time'] > self.data[id_str]['time']:
+                    self.data[id_str] = entry
+                    self.names[entry['user']['username'].lower()] = id_str
+            for name, seen in misses.items():
+                if name not in self.names:
+                    self.misses[name] = max(seen, self.misses.get(name, 0))
+            serial.dump({'users': self.data, 'misses': self.misses}, self.path, atomic=True)
+
+    def _fresh(self, entry:Optional[Dict]) -> Optional[Dict]:
+        if entry is not None and time.time() - entry['time'] < self.ttl:
+            return entry['user']
+        return None
+
+    def update(self, users:Dict[str,Dict]) -> None:
+        now = time.time()
+        for user in users.values():
+            self.data[user['id']] = {'user': user, 'time': now}
+            self.names[user['username'].lower()] = user['id']
+            self.misses.pop(user['username'].lower(), None)
+
+    def get_by_id(self, user_id:str) -> Optional[Dict]:
+        return self._fresh(self.data.get(user_id))
+
+    def get_by_name(self, username:str) -> Optional[Dict]:
+        return self.get_by_id(self.names.get(username.lower()))
+
+    def resolve(self, client:Any, usernames:Iterable[str]) -> Dict[str,Dict]:
+        """ Returns the users with the given usernames, looking up stale or unknown ones in batches of 100.
+
+            Args:
+                client (tweepy.Client): Registered and authenticated client.
+                usernames (Iterable[str]): Usernames to resolve.
+
+            Returns:
+                users (Dict): Resolved users, Key=user_id. Unknown (e.g. suspended) users are left out.
+
+        """
+        now = time.time()
+        users, missing = {}, []
+        for username in {username.lower():username for username in usernames}.values():
+            user = self.get_by_name(username)
+            if user is not None:
+                users[user['id']] = user
+            elif now - self.misses.get(username.lower(), 0) >= self.ttl:
+                missing.append(username)
+
+        for idx in range(0, len(missing), 100):
+            responses = client.get_users(usernames=missing[idx:idx + 100], user_fields=USER_FIELDS)
+            found = {user['id']:user for user in responses.get('data', [])}
+            self.update(found)
+            users.update(found)
+            for username in missing[idx:idx + 100]:
+                if username.lower() not in self.names:
+                    self.misses[username.lower()] = now
+        if missing:
+            log.info('Looked up %d users in %d requests.', len(missing), (len(missing) + 99) // 100)
+        return users
+
+    def close(self) -> None:
+        self._dump()
+        log.info('Dumping... %r', self)
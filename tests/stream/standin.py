@@ -0,0 +1,115 @@
+"""
+Local stand-in for the v2 filtered stream endpoints, to exercise `twiff.stream` without API access.
+
+Serves the stream rules and a stream of synthetic twiffs (see `twiff.utils.corpus`). Connections cycle through:
+    1. a keep-alive, tweets, a torn (unreadable) line, a tweet, then a chunk cut short (ChunkedEncodingError),
+    2. an HTTP 503 (exponential reconnect backoff),
+    3. tweets, then keep-alives until the client disconnects.
+
+Usage:
+    python standin.py --port 8080
+
+"""
+import sys
+import json
+import time
+import itertools
+import argparse
+
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2].joinpath("src")))
+from twiff.utils.corpus import TwiffCorpus
+
+RULES = []
+CONNECTIONS = itertools.count()
+
+
+def twiffs(seed:int):
+    # Quotes are left out: resolving their authors would call the user lookup endpoint.
+    for tweet, users in TwiffCorpus(seed=seed).generate(sys.maxsize):
+        if "referenced_tweets" not in tweet:
+            yield {"data": tweet, "includes": {"users": list(users.values())}, "matching_rules": RULES}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _json(self, code:int, body:dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data:bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _message(self) -> None:
+        self._chunk(json.dumps(next(self.server.twiffs)).encode() + b"\r\n")
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/2/tweets/search/stream/rules"):
+            return self._json(200, {"data": RULES, "meta": {"result_count": len(RULES)}})
+        if not self.path.startswith("/2/tweets/search/stream"):
+            return self._json(404, {"title": "Not Found"})
+
+        connection = next(CONNECTIONS)
+        scenario = connection % 3
+        self.log_message("Connection %d, scenario %d", connection, scenario + 1)
+        if scenario == 1:
+            self.close_connection = True
+            return self._json(503, {"title": "Service Unavailable"})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            if scenario == 0:
+                self._chunk(b"\r\n")
+                self._message()
+                self._message()
+                self._chunk(b'{"data": {"id": "1\r\n')
+                self._message()
+                # Announce 255 bytes and send 7: the client sees the connection break mid-chunk.
+                self.wfile.write(b"ff\r\npartial")
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self._message()
+            self._message()
+            while True:
+                time.sleep(self.server.keep_alive)
+                self._chunk(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.log_message("Client disconnected")
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.startswith("/2/tweets/search/stream/rules"):
+            return self._json(404, {"title": "Not Found"})
+        for rule in body.get("add", []):
+            RULES.append({"id": str(len(RULES) + 1), **rule})
+        RULES[:] = [rule for rule in RULES if rule["id"] not in body.get("delete", {}).get("ids", [])]
+        self._json(200, {"data": RULES, "meta": {"sent": time.strftime("%Y-%m-%dT%H:%M:%S.000Z")}})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Filtered stream stand-in")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic twiffs.")
+    parser.add_argument("--keep_alive", type=float, default=1.0, help="Seconds between keep-alive signals (20 on the API).")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    server.twiffs, server.keep_alive = twiffs(args.seed), args.keep_alive
+    print(f"Filtered stream stand-in on http://127.0.0.1:{args.port}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+#!/bin/sh
+# Runs the stream mode against the local stand-in (standin.py) until 5 tweets are processed: expect a skipped
+# unreadable message, a reconnect after a network error (cut chunk) and one after an HTTP 503. Output in ./work.
+cd "$(dirname "$0")"
+rm -rf work && mkdir work
+cp users.json work/ && cp ../../scripts/search/ignored_users.json work/
+
+python standin.py --port 8080 &
+STANDIN=$!
+trap 'kill $STANDIN' EXIT
+sleep 1
+
+cd work && TWITTER_API_KEYS_FILE=../keys.env python ../../../src/execute.py stream ../args.json
@@ -0,0 +1,68 @@
+"""
+Local stand-in for the map backend receiving the batches of `twiff.utils.upload.Uploader`.
+
+Accepts POST {"actions": [...]} on /api/actions. The first `--fail` requests get an HTTP 503 (retried by the
+uploader) and every `--reject_every`-th batch an HTTP 400 (kept in the spool's "rejected" directory). Batches are
+logged with their Idempotency-Key, repeated keys (retried or replayed batches) are flagged.
+
+Usage:
+    python standin.py --port 8081 --fail 1 --reject_every 3
+
+"""
+import json
+import argparse
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _json(self, code:int, body:dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/api/actions":
+            return self._json(404, {"error": "not found"})
+
+        server = self.server
+        server.requests += 1
+        if server.requests <= server.fail:
+            self.log_message("Request %d: failing with 503", server.requests)
+            return self._json(503, {"error": "unavailable"})
+
+        key, actions = self.headers.get("Idempotency-Key"), body.get("actions", [])
+        server.batches += 1
+        if server.reject_every and server.batches % server.reject_every == 0:
+            self.log_message("Batch %s (%d actions): rejecting with 400", key, len(actions))
+            return self._json(400, {"error": "rejected"})
+
+        duplicate = key in server.keys
+        server.keys.add(key)
+        self.log_message("Batch %s (%d actions): accepted%s, ids %s", key, len(actions), " (duplicate)" if duplicate else "",
+                         ", ".join(action["id"] for action in actions))
+        self._json(200, {"accepted": len(actions)})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Map backend stand-in")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--fail", type=int, default=0, help="Number of first requests answered with 503.")
+    parser.add_argument("--reject_every", type=int, default=0, help="Reject every n-th batch with 400, never if 0.")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    server.fail, server.reject_every = args.fail, args.reject_every
+    server.requests, server.batches, server.keys = 0, 0, set()
+    print(f"Map backend stand-in on http://127.0.0.1:{args.port}/api/actions", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
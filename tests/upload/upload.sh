@@ -0,0 +1,33 @@
+#!/bin/sh
+# Runs the stream mode (fed by the filtered stream stand-in) with uploads to the map backend stand-in
+# (standin.py) three times: backend up (a 503 retried, a rejected batch kept in spool/rejected), backend down
+# (batches spooled) and backend back up (spool drained first). Output in ./work.
+cd "$(dirname "$0")"
+rm -rf work && mkdir work
+cp ../stream/users.json work/ && cp ../../scripts/search/ignored_users.json work/
+
+run() {
+    (cd work && TWITTER_API_KEYS_FILE=../../stream/keys.env python ../../../src/execute.py stream ../args.json)
+}
+
+python ../stream/standin.py --port 8080 &
+STREAM=$!
+python standin.py --port 8081 --fail 1 --reject_every 3 &
+UPLOAD=$!
+trap 'kill $STREAM $UPLOAD 2>/dev/null' EXIT
+sleep 1
+
+echo "=== Backend up"
+run
+kill $UPLOAD && wait $UPLOAD 2>/dev/null
+
+echo "=== Backend down"
+run
+echo "Spooled batches:" && ls work/spool
+
+echo "=== Backend back up"
+python standin.py --port 8081 &
+UPLOAD=$!
+sleep 1
+run
+echo "Spooled batches:" && ls work/spool && echo "Rejected batches:" && ls work/spool/rejected